@@ -0,0 +1,304 @@
+"""多进程批量导出
+
+每张图片封装为可序列化的 ExportJob（输入路径、输出路径、水印参数、导出参数），
+导出分为三个阶段：读取（把源文件读入内存）、计算（解码、缩放、合成水印）、写出（编码并写入文件）。
+多进程时由进程池中的 worker 依次执行三个阶段；单进程时三个阶段各占一个线程，
+经有界队列组成流水线，Pillow 在解码、缩放和编码时会释放 GIL，磁盘或网络读写与计算可以重叠。
+设置了内存上限时，读取阶段只按图片头信息检查预算、不把文件读入内存，计算与写出合为一个线程，
+任何时刻只有一张解码后的图片，单个进程的内存仍受 memory_limit_mb 约束。
+同时在途的任务数有上限，结果按提交顺序返回，便于按顺序汇报进度；每个结果都带有各阶段耗时。
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+import io
+import itertools
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+from PIL import UnidentifiedImageError
+
+from image_processor import (
+    WatermarkSettings, ExportOptions, check_file_budget, get_output_path, render_image, save_image
+)
+
+STAGES = ("read", "compute", "write")
+PIPELINE_QUEUE_SIZE = 2  # 阶段之间最多排队的图片数，计算与写出之间排队的是已解码的整张图片
+
+
+@dataclass(frozen=True)
+class ExportJob:
+    input_path: str
+    output_path: str
+    settings: WatermarkSettings
+    options: ExportOptions
+
+
+@dataclass(frozen=True)
+class ExportResult:
+    index: int
+    job: ExportJob
+    elapsed: float
+    input_bytes: int = 0
+    output_bytes: int = 0
+    error: str = None
+    stage_times: dict = field(default_factory=dict)  # 阶段名 -> 耗时（秒），出错时只包含已执行的阶段
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def default_worker_count():
+    return os.cpu_count() or 1
+
+
+def build_jobs(image_paths, output_folder, settings, options):
+    for input_path in image_paths:
+        yield ExportJob(input_path, get_output_path(input_path, output_folder, options), settings, options)
+
+
+def read_job(job):
+    """读取阶段：把源文件整个读入内存；设置了内存上限时只检查图片头信息，返回 None"""
+    if job.options.memory_limit_mb > 0:
+        # 先按图片头信息拒绝超大图片，也不缓存整个文件，计算阶段直接从文件流式解码
+        check_file_budget(job.input_path, job.options)
+        return None
+    with open(job.input_path, "rb") as f:
+        return f.read()
+
+
+def compute_job(job, data):
+    """计算阶段：解码（data 为 None 时直接读文件）、缩放并合成水印"""
+    if data is None:
+        return render_image(job.input_path, job.settings, job.options)
+    try:
+        return render_image(io.BytesIO(data), job.settings, job.options)
+    except UnidentifiedImageError:
+        # 从内存解码时 Pillow 的错误信息里只有 BytesIO 对象，换成源文件路径
+        raise UnidentifiedImageError(f"cannot identify image file {job.input_path!r}") from None
+
+
+def write_job(job, img):
+    """写出阶段：编码并写入导出文件，返回导出文件大小"""
+    save_image(img, job.output_path, job.options)
+    return os.path.getsize(job.output_path)
+
+
+def format_error(e):
+    return f"{type(e).__name__}: {e}"
+
+
+class _PipelineItem:
+    """单个导出任务在各阶段之间传递的状态，payload 为上一阶段的产物"""
+    __slots__ = ("index", "job", "payload", "input_bytes", "error", "stage_times")
+
+    def __init__(self, index, job):
+        self.index = index
+        self.job = job
+        self.payload = None
+        self.input_bytes = 0
+        self.error = None
+        self.stage_times = {}
+
+    def run(self, stage):
+        """执行一个阶段，记录耗时；出错后后续阶段不再执行"""
+        if self.error is not None:
+            return
+        start = time.perf_counter()
+        try:
+            if stage == "read":
+                self.payload = read_job(self.job)
+                self.input_bytes = os.path.getsize(self.job.input_path) if self.payload is None else len(self.payload)
+            elif stage == "compute":
+                self.payload = compute_job(self.job, self.payload)
+            else:
+                self.payload = write_job(self.job, self.payload)
+        except Exception as e:
+            self.payload = None
+            self.error = format_error(e)
+        self.stage_times[stage] = time.perf_counter() - start
+
+    def result(self):
+        output_bytes = self.payload if self.error is None else 0
+        return ExportResult(self.index, self.job, sum(self.stage_times.values()), self.input_bytes, output_bytes,
+                            self.error, self.stage_times)
+
+
+def run_job(index, job):
+    """在 worker 进程中依次执行三个阶段，异常转为错误信息返回"""
+    item = _PipelineItem(index, job)
+    for stage in STAGES:
+        item.run(stage)
+    return item.result()
+
+
+# ---------- 单进程流水线 ----------
+
+_DONE = object()  # 上游已没有任务
+
+
+def _put(q, item, stop):
+    """放入有界队列；调用方停止迭代后放弃，返回是否放入"""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(q, stop):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return _DONE
+
+
+def _read_stage(jobs, outbox, stop):
+    try:
+        for index, job in enumerate(jobs):
+            item = _PipelineItem(index, job)
+            item.run("read")
+            if not _put(outbox, item, stop):
+                return
+    except Exception as e:
+        # 任务生成器本身出错（如扫描失败），交给调用方重新抛出
+        _put(outbox, e, stop)
+        return
+    _put(outbox, _DONE, stop)
+
+
+def _work_stage(stages, inbox, outbox, stop):
+    while True:
+        item = _get(inbox, stop)
+        if not isinstance(item, _PipelineItem):
+            _put(outbox, item, stop)
+            return
+        for stage in stages:
+            item.run(stage)
+        if not _put(outbox, item, stop):
+            return
+
+
+def export_pipelined(jobs, queue_size=PIPELINE_QUEUE_SIZE):
+    """在当前进程内以读取、计算、写出三个线程流水线导出，按任务顺序逐个产出 ExportResult
+
+    阶段之间是容量为 queue_size 的有界队列，较慢的阶段会让上游阻塞，内存占用不随批量大小增长。
+    任务设置了内存上限时，计算与写出在同一线程中执行、队列容量为 1，同时只保留一张解码后的图片。
+    调用方提前停止迭代时，各线程在当前图片处理完后退出。
+    """
+    jobs = iter(jobs)
+    first = next(jobs, None)
+    if first is None:
+        return
+    jobs = itertools.chain([first], jobs)
+    if first.options.memory_limit_mb > 0:
+        groups = [("compute", "write")]
+        queue_size = 1
+    else:
+        groups = [("compute",), ("write",)]
+    stop = threading.Event()
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(groups) + 1)]
+    threads = [threading.Thread(target=_read_stage, args=(jobs, queues[0], stop), name="export-read")]
+    for i, stages in enumerate(groups):
+        threads.append(threading.Thread(target=_work_stage, args=(stages, queues[i], queues[i + 1], stop),
+                                        name="export-" + "-".join(stages)))
+    write_queue = queues[-1]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    try:
+        while True:
+            item = write_queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item.result()
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+def add_stage_times(totals, result):
+    """把结果的各阶段耗时累加到 totals（阶段名 -> 秒）；累计耗时最长的阶段即瓶颈"""
+    for stage, seconds in result.stage_times.items():
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return totals
+
+
+def create_executor(workers):
+    """导出用的进程池；使用 spawn，避免在已创建 Qt 对象的进程中 fork"""
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def is_pool_broken(result):
+    """结果是否因进程池损坏而失败；此后该进程池不能再提交任务"""
+    return result.error is not None and result.error.startswith(BrokenProcessPool.__name__ + ":")
+
+
+def export_parallel(jobs, workers=None, max_in_flight=None, executor=None):
+    """用进程池并行导出，按任务顺序逐个产出 ExportResult
+
+    workers: 进程数，默认等于 CPU 核数；为 1 时在当前进程内以线程流水线执行（见 export_pipelined）。
+    max_in_flight: 同时提交（含已完成但尚未产出）的任务上限，默认 workers * 2，
+    jobs 可以是生成器，任务按需取出，内存占用不随批量大小增长。
+    executor: 调用方持有的进程池（见 create_executor），多批导出可复用同一组 worker 进程，结束后不关闭。
+    """
+    workers = workers or default_worker_count()
+    if workers <= 1:
+        yield from export_pipelined(jobs)
+        return
+    max_in_flight = max(max_in_flight or workers * 2, workers)
+    jobs_iter = enumerate(jobs)
+    pending = {}  # 序号 -> (任务, future)；进程池损坏后提交的任务 future 为 None
+    next_index = 0
+    exhausted = False
+    broken = None  # 进程池损坏时的异常（如 worker 被系统因内存不足杀死），之后的任务直接报告失败
+    owns_executor = executor is None
+    if owns_executor:
+        executor = create_executor(workers)
+    try:
+        while True:
+            while not exhausted and len(pending) < max_in_flight:
+                try:
+                    index, job = next(jobs_iter)
+                except StopIteration:
+                    exhausted = True
+                    break
+                future = None
+                if broken is None:
+                    try:
+                        future = executor.submit(run_job, index, job)
+                    except BrokenProcessPool as e:
+                        broken = e
+                pending[index] = (job, future)
+            if next_index not in pending:
+                break
+            job, future = pending.pop(next_index)
+            if future is None:
+                result = ExportResult(next_index, job, 0.0, error=format_error(broken))
+            else:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    if isinstance(e, BrokenProcessPool):
+                        broken = e
+                    result = ExportResult(next_index, job, 0.0, error=format_error(e))
+            yield result
+            next_index += 1
+    finally:
+        # 调用方提前停止迭代时，取消尚未开始的任务
+        for _, future in pending.values():
+            if future is not None:
+                future.cancel()
+        if owns_executor:
+            executor.shutdown(wait=True)
@@ -0,0 +1,105 @@
+"""比较 Pillow 与 NumPy 合成实现的速度
+
+    python benchmarks/bench_compositing.py
+    python benchmarks/bench_compositing.py --repeat 50 --sizes 1920x1080 6000x4000
+
+对每种画面尺寸测量一次导出中的水印合成（文本图块 + 图片水印，含复制底图的耗时），
+以及图片水印的透明度缩放，并报告两种实现的最大像素差。
+"""
+import argparse
+import os
+import sys
+import time
+
+from PIL import Image, ImageChops
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from compositing import BACKENDS, available_backends, blend_region, np, scale_alpha  # noqa: E402
+from image_processor import WatermarkSettings, get_text_stamp, read_templates  # noqa: E402
+
+DEFAULT_SIZES = ("1280x720", "1920x1080", "4000x3000", "6000x4000")
+
+
+def parse_size(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def make_background(size, mode):
+    """带渐变的底图，避免纯色图片让某种实现占便宜"""
+    gradient = Image.linear_gradient("L").resize(size)
+    channels = [gradient, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT), gradient.transpose(Image.Transpose.FLIP_TOP_BOTTOM)]
+    if mode == "RGBA":
+        channels.append(Image.new("L", size, 200))
+    return Image.merge(mode, channels)
+
+
+def make_logo(size):
+    logo = make_background(size, "RGBA")
+    mask = Image.radial_gradient("L").resize(size)
+    logo.putalpha(ImageChops.invert(mask))
+    return logo
+
+
+def timeit(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_size(size, stamp, logo, repeat):
+    rows = []
+    for mode in ("RGB", "RGBA"):
+        base = make_background(size, mode)
+        dest = (size[0] - stamp.width - 20, size[1] - stamp.height - 20)
+        outputs = {}
+        timings = {}
+        for backend in BACKENDS:
+            def run():
+                img = base.copy()
+                blend_region(img, stamp, dest, backend)
+                blend_region(img, logo, (20, 20), backend)
+                return img
+            outputs[backend] = run()
+            timings[backend] = timeit(run, repeat)
+        diff = max(ImageChops.difference(outputs["pillow"], outputs["numpy"]).getextrema(), key=lambda e: e[1])[1]
+        rows.append((f"{size[0]}x{size[1]} {mode}", timings["pillow"], timings["numpy"], diff))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="比较 Pillow 与 NumPy 合成实现的速度")
+    parser.add_argument("--sizes", nargs="+", default=DEFAULT_SIZES, help="画面尺寸，如 1920x1080")
+    parser.add_argument("--repeat", type=int, default=20, help="每项重复次数，取最快一次")
+    parser.add_argument("--template", default="default", help="文本水印使用的模板")
+    args = parser.parse_args(argv)
+    if available_backends() != BACKENDS:
+        print("未安装 NumPy，只能使用 Pillow 实现")
+        return 1
+
+    settings = WatermarkSettings.from_dict(read_templates().get(args.template, {"watermark_text": "Watermark"}))
+    stamp = get_text_stamp(settings).image
+    logo = make_logo((400, 300))
+
+    print(f"NumPy {np.__version__}，文本图块 {stamp.width}x{stamp.height}，图片水印 {logo.width}x{logo.height}")
+    print(f"{'画面':<18}{'Pillow (ms)':>12}{'NumPy (ms)':>12}{'加速':>8}{'最大差值':>10}")
+    for size in args.sizes:
+        for name, pillow_time, numpy_time, diff in bench_size(parse_size(size), stamp, logo, args.repeat):
+            speedup = pillow_time / numpy_time if numpy_time > 0 else float("inf")
+            print(f"{name:<18}{pillow_time * 1000:>12.2f}{numpy_time * 1000:>12.2f}{speedup:>7.1f}x{diff:>10}")
+
+    print()
+    print(f"{'透明度缩放':<18}{'Pillow (ms)':>12}{'NumPy (ms)':>12}")
+    for logo_size in ((400, 300), (1600, 1200)):
+        big_logo = make_logo(logo_size)
+        times = [timeit(lambda: scale_alpha(big_logo, 60, backend), args.repeat) for backend in BACKENDS]
+        print(f"{logo_size[0]}x{logo_size[1]:<13}{times[0] * 1000:>12.2f}{times[1] * 1000:>12.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
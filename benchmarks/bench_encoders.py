@@ -0,0 +1,81 @@
+"""比较各导出格式、各编码档位的编码耗时与文件大小
+
+    python benchmarks/bench_encoders.py
+    python benchmarks/bench_encoders.py --image photo.jpg --repeat 5 --quality 85
+
+默认使用带噪点的渐变合成图（接近照片的压缩难度），也可用 --image 指定真实照片；
+只编码到内存，不计磁盘写入。未编译 WebP/AVIF 编码器的 Pillow 会跳过对应格式。
+"""
+import argparse
+import io
+import os
+import sys
+import time
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from encoders import DEFAULT_PROFILE, ENCODER_PROFILES, FORMATS, available_formats, encode_image  # noqa: E402
+
+
+def parse_size(text):
+    width, height = text.lower().split("x")
+    return int(width), int(height)
+
+
+def make_photo(size):
+    """渐变叠加噪点：纯渐变压缩得过好，不能代表照片"""
+    gradient = Image.linear_gradient("L").resize(size)
+    channels = [gradient, gradient.transpose(Image.Transpose.FLIP_LEFT_RIGHT), gradient.transpose(Image.Transpose.FLIP_TOP_BOTTOM)]
+    noise = Image.effect_noise(size, 40).convert("RGB")
+    return Image.blend(Image.merge("RGB", channels), noise, 0.25)
+
+
+def encode(img, output_format, quality, profile):
+    buffer = io.BytesIO()
+    encode_image(img, buffer, output_format, quality, profile)
+    return buffer.tell()
+
+
+def timeit(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="比较各导出格式、各编码档位的编码耗时与文件大小")
+    parser.add_argument("--image", help="测试图片，默认使用合成图")
+    parser.add_argument("--size", default="2000x1500", help="合成图尺寸，如 3000x2000")
+    parser.add_argument("--quality", type=int, default=80, help="JPEG/WebP/AVIF 质量")
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数，取最快一次")
+    args = parser.parse_args(argv)
+
+    if args.image:
+        with Image.open(args.image) as source:
+            img = source.convert("RGB")
+    else:
+        img = make_photo(parse_size(args.size))
+    formats = available_formats()
+    skipped = [fmt for fmt in FORMATS if fmt not in formats]
+
+    print(f"图片 {img.width}x{img.height}，质量 {args.quality}" + (f"，跳过不支持的格式: {', '.join(skipped)}" if skipped else ""))
+    print(f"{'格式':<8}{'档位':<10}{'耗时 (ms)':>10}{'大小 (KB)':>11}{'相对默认耗时':>14}{'相对默认大小':>14}")
+    for output_format in formats:
+        baseline = None
+        for profile in ENCODER_PROFILES:
+            size = encode(img, output_format, args.quality, profile)
+            elapsed = timeit(lambda: encode(img, output_format, args.quality, profile), args.repeat)
+            if profile == DEFAULT_PROFILE:
+                baseline = (elapsed, size)
+            print(f"{output_format:<8}{profile:<10}{elapsed * 1000:>10.1f}{size / 1024:>11.1f}"
+                  f"{elapsed / baseline[0]:>13.2f}x{size / baseline[1]:>13.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+"""命令行批量加水印（无需 PyQt5 和显示器）
+
+示例：
+    python cli.py photos/ "uploads/**/*.jpg" -o out --template default --jobs 8 --json
+
+退出码：0 全部成功；1 有图片处理失败；2 参数错误（模板不存在、没有输入图片等）。
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+from image_processor import SIZE_MODES, TEMPLATE_EXPORT_KEYS, ExportOptions, WatermarkSettings, read_templates
+from encoders import ENCODER_PROFILES, FORMATS, available_formats
+from compositing import BACKENDS, DEFAULT_BACKEND
+from batch_export import STAGES, add_stage_times, build_jobs, default_worker_count, export_parallel
+from export_manifest import MANIFEST_NAME, ExportManifest, IncrementalExport
+from image_scanner import normalize_path, scan_images
+from watch_folder import FolderWatcher
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+
+STAGE_NAMES = {"read": "读取", "compute": "计算", "write": "写出"}
+
+
+class UsageError(Exception):
+    pass
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="批量为图片添加水印")
+    parser.add_argument("inputs", nargs="+", help="输入图片、文件夹或通配符（支持 **）")
+    parser.add_argument("-o", "--output", required=True, help="导出文件夹，不存在时自动创建")
+    parser.add_argument("-t", "--template", default="default", help="templates.json 中的模板名称")
+    parser.add_argument("--templates-file", help="模板文件路径，默认使用用户目录或程序自带的 templates.json")
+    parser.add_argument("-f", "--format", choices=FORMATS, help="导出格式，默认使用模板中的格式或 jpeg（webp、avif 需 Pillow 支持）")
+    parser.add_argument("-q", "--quality", type=int, help="JPEG/WebP/AVIF 质量 0-100，默认使用模板中的质量或 80")
+    parser.add_argument("--encoder", choices=tuple(ENCODER_PROFILES),
+                        help="编码档位：default 与旧版一致，fast 编码最快，small 文件最小，fidelity 不做色度降采样；默认使用模板中的档位")
+    parser.add_argument("--resize", choices=SIZE_MODES, default="original", help="导出尺寸模式")
+    parser.add_argument("--width", type=int, default=800, help="--resize width 时的宽度")
+    parser.add_argument("--height", type=int, default=600, help="--resize height 时的高度")
+    parser.add_argument("--percent", type=int, default=100, help="--resize percent 时的百分比")
+    parser.add_argument("--prefix", default="", help="导出文件名前缀")
+    parser.add_argument("--suffix", default="", help="导出文件名后缀")
+    parser.add_argument("--include", action="append", help="只处理匹配的文件（可多次指定）")
+    parser.add_argument("--exclude", action="append", help="跳过匹配的文件或文件夹（可多次指定）")
+    parser.add_argument("--no-fast-decode", action="store_true", help="缩小导出时也完整解码原图")
+    parser.add_argument("--memory-limit", type=int, default=0, metavar="MB",
+                        help="每个进程处理单张图片的内存上限，超出上限的图片不解码，直接报告失败")
+    parser.add_argument("--backend", choices=BACKENDS, default=DEFAULT_BACKEND,
+                        help="水印合成实现，未安装 NumPy 时 numpy 自动退回 pillow")
+    parser.add_argument("-j", "--jobs", type=int, default=default_worker_count(), help="并行进程数，默认等于 CPU 核数")
+    parser.add_argument("--json", action="store_true", help="以 JSON Lines 输出进度与汇总")
+    parser.add_argument("--incremental", action="store_true", help="跳过源图与参数均未变化、导出文件仍有效的图片")
+    parser.add_argument("--watch", action="store_true",
+                        help="持续监视输入文件夹，只处理新增或修改的图片（Ctrl+C 退出）；不支持通配符，请监视文件夹并用 --include 筛选文件")
+    parser.add_argument("--interval", type=float, default=2.0, help="--watch 时的轮询间隔（秒）")
+    parser.add_argument("--settle", type=float, default=2.0, help="--watch 时文件最后修改后需等待的秒数，避免处理写入中的文件")
+    parser.add_argument("--manifest", help="导出清单路径（--incremental、--watch），默认为导出文件夹下的 " + MANIFEST_NAME)
+    return parser
+
+
+def load_template(template_name, templates_file=None):
+    if templates_file and not os.path.exists(templates_file):
+        raise UsageError(f"模板文件不存在: {templates_file}")
+    templates = read_templates(templates_file)
+    if template_name not in templates:
+        raise UsageError(f"模板不存在: {template_name}（可用: {', '.join(templates) or '无'}）")
+    return templates[template_name]
+
+
+def is_glob(item):
+    return any(char in item for char in "*?[")
+
+
+def expand_inputs(inputs):
+    """展开通配符；不存在的输入视为参数错误"""
+    roots = []
+    for item in inputs:
+        if is_glob(item):
+            matches = sorted(glob.glob(item, recursive=True))
+            if not matches:
+                raise UsageError(f"没有匹配的文件: {item}")
+            roots.extend(matches)
+        elif os.path.exists(item):
+            roots.append(item)
+        else:
+            raise UsageError(f"输入不存在: {item}")
+    return roots
+
+
+def collect_images(inputs, include=None, exclude=None):
+    roots = expand_inputs(inputs)
+    return [path for batch in scan_images(roots, include, exclude) for path in batch]
+
+
+def build_options(args, template):
+    """命令行参数优先，未指定的格式、质量、编码档位取自模板"""
+    saved = ExportOptions.from_dict({key: template[key] for key in TEMPLATE_EXPORT_KEYS if key in template})
+    output_format = args.format or saved.output_format
+    if output_format not in available_formats():
+        raise UsageError(f"当前 Pillow 不支持导出 {output_format} 格式（可用: {', '.join(available_formats())}）")
+    encoder_profile = args.encoder or saved.encoder_profile
+    if encoder_profile not in ENCODER_PROFILES:
+        raise UsageError(f"编码档位不存在: {encoder_profile}")
+    return ExportOptions(
+        output_format=output_format,
+        quality=saved.quality if args.quality is None else args.quality,
+        encoder_profile=encoder_profile,
+        prefix=args.prefix,
+        suffix=args.suffix,
+        size_mode=args.resize,
+        width=args.width,
+        height=args.height,
+        percent=args.percent,
+        fast_decode=not args.no_fast_decode,
+        memory_limit_mb=args.memory_limit,
+        compositing_backend=args.backend,
+    )
+
+
+def emit(args, event, message):
+    if args.json:
+        print(json.dumps(event, ensure_ascii=False), flush=True)
+    else:
+        print(message, file=sys.stderr if event.get("ok") is False else sys.stdout, flush=True)
+
+
+def report_progress(args, result, done, total):
+    event = {
+        "event": "progress",
+        "done": done,
+        "total": total,
+        "input": result.job.input_path,
+        "output": result.job.output_path,
+        "ok": result.ok,
+        "error": result.error,
+        "elapsed": round(result.elapsed, 4),
+        "stages": {stage: round(seconds, 4) for stage, seconds in result.stage_times.items()},
+    }
+    if result.ok:
+        message = f"[{done}/{total}] 已导出: {result.job.output_path}"
+    else:
+        message = f"[{done}/{total}] 导出失败: {result.job.input_path} ({result.error})"
+    emit(args, event, message)
+
+
+def run(args):
+    template = load_template(args.template, args.templates_file)
+    settings = WatermarkSettings.from_dict(template)
+    options = build_options(args, template)
+    image_paths = collect_images(args.inputs, args.include, args.exclude)
+    if not image_paths:
+        raise UsageError("没有找到可处理的图片")
+    output_folder = os.path.abspath(args.output)
+    # 与界面一致：禁止导出到原文件夹，防止覆盖原图
+    for input_path in image_paths:
+        if os.path.abspath(os.path.dirname(input_path)) == output_folder:
+            raise UsageError(f"禁止导出到原文件夹: {output_folder}")
+    os.makedirs(output_folder, exist_ok=True)
+
+    total = len(image_paths)
+    succeeded = 0
+    failed = 0
+    start = time.perf_counter()
+    manifest = ExportManifest(args.manifest) if args.manifest else None
+    incremental = IncrementalExport(output_folder, settings, options, manifest, skip=args.incremental)
+    jobs = incremental.select(build_jobs(image_paths, output_folder, settings, options))
+    done = 0
+    stage_totals = dict.fromkeys(STAGES, 0.0)
+    try:
+        for result in export_parallel(jobs, workers=args.jobs):
+            incremental.record(result)
+            add_stage_times(stage_totals, result)
+            done += 1
+            if result.ok:
+                succeeded += 1
+            else:
+                failed += 1
+            report_progress(args, result, done + incremental.skipped, total)
+    finally:
+        incremental.save()
+
+    elapsed = time.perf_counter() - start
+    summary = {
+        "event": "summary",
+        "total": total,
+        "succeeded": succeeded,
+        "failed": failed,
+        "skipped": incremental.skipped,
+        "elapsed": round(elapsed, 3),
+        "images_per_sec": round(done / elapsed, 2) if elapsed > 0 else None,
+        # 各阶段累计耗时（所有进程或线程之和），最长的阶段即瓶颈
+        "stages": {stage: round(seconds, 3) for stage, seconds in stage_totals.items()},
+    }
+    message = f"完成：成功 {succeeded} 张，失败 {failed} 张"
+    if incremental.skipped:
+        message += f"，跳过未变化的 {incremental.skipped} 张"
+    message += f"，用时 {elapsed:.1f} 秒"
+    if done:
+        stages = "，".join(f"{STAGE_NAMES[stage]} {seconds:.1f} 秒" for stage, seconds in stage_totals.items())
+        message += f"\n各阶段累计耗时：{stages}"
+    emit(args, summary, message)
+    return EXIT_OK if failed == 0 else EXIT_FAILED
+
+
+def run_watch(args):
+    template = load_template(args.template, args.templates_file)
+    settings = WatermarkSettings.from_dict(template)
+    options = build_options(args, template)
+    # 通配符只在启动时展开一次，之后新增的文件不会被监视到
+    globs = [item for item in args.inputs if is_glob(item)]
+    if globs:
+        raise UsageError(f"--watch 不支持通配符: {', '.join(globs)}（请监视所在文件夹并用 --include 指定文件名规则）")
+    roots = expand_inputs(args.inputs)
+    output_folder = os.path.abspath(args.output)
+    if any(os.path.isdir(root) and normalize_path(root) == normalize_path(output_folder) for root in roots):
+        raise UsageError(f"禁止导出到原文件夹: {output_folder}")
+    os.makedirs(output_folder, exist_ok=True)
+    manifest = ExportManifest(args.manifest) if args.manifest else None
+    watcher = FolderWatcher(roots, output_folder, settings, options, workers=args.jobs, interval=args.interval,
+                            settle_time=args.settle, include=args.include, exclude=args.exclude, manifest=manifest)
+    counts = {"succeeded": 0, "failed": 0}
+
+    def on_result(result):
+        counts["succeeded" if result.ok else "failed"] += 1
+        event = {
+            "event": "progress",
+            "input": result.job.input_path,
+            "output": result.job.output_path,
+            "ok": result.ok,
+            "error": result.error,
+            "elapsed": round(result.elapsed, 4),
+        }
+        if result.ok:
+            message = f"已导出: {result.job.output_path}"
+        else:
+            message = f"导出失败: {result.job.input_path} ({result.error})"
+        emit(args, event, message)
+
+    emit(args, {"event": "watching", "inputs": roots, "output": output_folder},
+         f"正在监视: {', '.join(roots)}（Ctrl+C 退出）")
+    watcher.run(on_result)
+    emit(args, {"event": "summary", **counts}, f"已停止：成功 {counts['succeeded']} 张，失败 {counts['failed']} 张")
+    return EXIT_OK
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return run_watch(args) if args.watch else run(args)
+    except UsageError as e:
+        if args.json:
+            print(json.dumps({"event": "error", "error": str(e)}, ensure_ascii=False), flush=True)
+        else:
+            print(f"错误: {e}", file=sys.stderr)
+        return EXIT_USAGE
+
+
+if __name__ == "__main__":
+    sys.exit(main())
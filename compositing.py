@@ -0,0 +1,89 @@
+"""水印区域的合成内核：Pillow 实现与可选的 NumPy 实现
+
+两种实现结果一致（带透明通道的底图上 NumPy 的取整方式不同，个别像素可能相差 1 个灰阶）。
+benchmarks/bench_compositing.py 比较两者的速度：Pillow 的 alpha_composite 是 C 实现，
+在常见的水印尺寸上比 NumPy 实现更快，因此默认使用 Pillow；NumPy 实现需显式指定
+（ExportOptions.compositing_backend 或命令行 --backend），未安装 NumPy 时自动退回 Pillow。
+"""
+from PIL import Image
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+BACKENDS = ("pillow", "numpy")
+DEFAULT_BACKEND = "pillow"
+
+
+def available_backends():
+    return tuple(backend for backend in BACKENDS if backend != "numpy" or np is not None)
+
+
+def check_backend(backend):
+    """返回实际使用的合成实现；未安装 NumPy 时 numpy 退回 pillow"""
+    backend = backend or DEFAULT_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"不支持的合成实现: {backend}")
+    if backend == "numpy" and np is None:
+        return "pillow"
+    return backend
+
+
+# ---------- 透明度 ----------
+
+def scale_alpha(img, opacity, backend=None):
+    """把 RGBA 图片的透明通道乘以 opacity%，返回新图片"""
+    if check_backend(backend) == "numpy":
+        arr = np.array(img)
+        arr[..., 3] = arr[..., 3].astype(np.uint16) * opacity // 100
+        return Image.fromarray(arr, "RGBA")
+    img = img.copy()
+    table = [int(p * opacity / 100) for p in range(256)]
+    img.putalpha(img.getchannel("A").point(table))
+    return img
+
+
+# ---------- 合成 ----------
+
+def blend_region(img, tile, dest, backend=None):
+    """把 RGBA 图块合成到 RGB/RGBA 图片的 dest 处并贴回，图块必须完全落在画面内；就地修改 img"""
+    box = (dest[0], dest[1], dest[0] + tile.width, dest[1] + tile.height)
+    if check_backend(backend) == "numpy":
+        region = np.asarray(img.crop(box))
+        src = np.asarray(tile)
+        blended = _blend_over_numpy(region, src) if img.mode == "RGBA" else _blend_opaque_numpy(region, src)
+        img.paste(Image.fromarray(blended, img.mode), box)
+        return img
+    if img.mode == "RGBA":
+        img.alpha_composite(tile, dest)
+        return img
+    region = img.crop(box).convert("RGBA")
+    region.alpha_composite(tile)
+    img.paste(region.convert(img.mode), box)
+    return img
+
+
+def _blend_opaque_numpy(region, src):
+    """不透明底图：预乘图块颜色后 out = (src·a + dst·(255 - a)) / 255，16 位整数就地运算"""
+    alpha = src[..., 3:4].astype(np.uint16)
+    out = src[..., :3] * alpha
+    out += region * (255 - alpha)
+    # 四舍五入地除以 255：(x + 128 + ((x + 128) >> 8)) >> 8
+    out += 128
+    out += out >> 8
+    out >>= 8
+    return out.astype(np.uint8)
+
+
+def _blend_over_numpy(region, src):
+    """带透明通道的底图：预乘后做 Porter-Duff over，再除回直通 alpha"""
+    src = src.astype(np.float32) / 255
+    dst = region.astype(np.float32) / 255
+    src_a = src[..., 3:4]
+    dst_a = dst[..., 3:4] * (1 - src_a)
+    out_a = src_a + dst_a
+    out_rgb = src[..., :3] * src_a + dst[..., :3] * dst_a
+    np.divide(out_rgb, out_a, out=out_rgb, where=out_a > 0)
+    out = np.concatenate((out_rgb, out_a), axis=-1)
+    return (out * 255 + 0.5).astype(np.uint8)
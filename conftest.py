@@ -0,0 +1 @@
+# 让直接运行 pytest 时也能从仓库根目录导入 image_processor 等模块
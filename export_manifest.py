@@ -0,0 +1,205 @@
+"""导出清单：记录每张源图最近一次导出时的指纹，用于跳过已是最新的图片
+
+清单是导出文件夹中的一个 JSON 文件，键为规范化的源图路径，值包括源图的修改时间、大小、
+水印参数指纹和导出文件路径。新记录逐行追加到旁边的日志文件（清单路径 + ".log"），
+每条记录的写入开销是常数；日志行数超过清单条目数时才合并进 JSON 文件，合并总开销与图片数成正比。
+合并时先写临时文件再替换，中途退出也不会损坏已有记录，日志中写了一半的最后一行在读取时忽略。
+"""
+from dataclasses import asdict
+from functools import lru_cache
+import hashlib
+import json
+import os
+import sys
+
+from image_scanner import normalize_path
+
+MANIFEST_NAME = ".watermark_manifest.json"
+MANIFEST_VERSION = 1
+MANIFEST_COMPACT_MIN = 1024  # 日志少于这么多行时不合并
+# 由图片内容决定、重试也不会成功的错误；其他错误（读写失败、worker 异常退出等）下次仍会重试
+PERMANENT_ERRORS = ("UnidentifiedImageError", "DecompressionBombError", "MemoryBudgetError")
+
+
+def is_permanent_error(error):
+    """error 为 ExportResult.error 形式的 "类型: 信息" 字符串"""
+    return error is not None and error.split(":", 1)[0] in PERMANENT_ERRORS
+
+
+@lru_cache(maxsize=16)
+def _file_digest(path, mtime, size):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_digest(path):
+    """文件内容的哈希，按 (路径, 修改时间, 大小) 缓存；文件不存在时返回 None"""
+    try:
+        stat = os.stat(path)
+    except (OSError, TypeError):
+        return None
+    return _file_digest(os.path.abspath(path), stat.st_mtime, stat.st_size)
+
+
+def settings_fingerprint(settings, options):
+    """水印参数、图片水印文件内容与导出参数的指纹"""
+    payload = json.dumps({
+        "settings": asdict(settings),
+        "logo": file_digest(settings.image_watermark_path) if settings.image_watermark_path else None,
+        # 内存上限与合成实现不影响导出结果（两种合成实现至多相差 1 个灰阶）
+        "options": {key: value for key, value in asdict(options).items()
+                    if key not in ("memory_limit_mb", "compositing_backend")},
+    }, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _ends_with_newline(path):
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+class ExportManifest:
+    def __init__(self, path):
+        self.path = path
+        self.log_path = path + ".log"
+        self.entries = {}
+        self.log_lines = 0  # 日志中尚未合并的记录数
+        self._log = None
+        self.load()
+
+    @classmethod
+    def for_output_folder(cls, output_folder):
+        return cls(os.path.join(output_folder, MANIFEST_NAME))
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == MANIFEST_VERSION:
+                self.entries = data.get("entries", {})
+        except (OSError, ValueError):
+            pass
+        try:
+            with open(self.log_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        key, entry = json.loads(line)
+                    except ValueError:
+                        continue  # 上次中途退出时写了一半的行
+                    self.entries[key] = entry
+                    self.log_lines += 1
+        except OSError:
+            pass
+
+    def save(self):
+        """把日志写入磁盘；日志比清单本身还长时合并进 JSON 文件"""
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        if self.log_lines > max(len(self.entries), MANIFEST_COMPACT_MIN):
+            self.compact()
+
+    def compact(self):
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "entries": self.entries}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        # 替换后再删除日志：中途退出时重放日志得到的结果相同
+        try:
+            os.remove(self.log_path)
+        except FileNotFoundError:
+            pass
+        self.log_lines = 0
+
+    def is_current(self, input_path, stat, fingerprint):
+        """源图与参数都未变化时返回 True；上次因图片内容失败（见 PERMANENT_ERRORS）也视为最新，避免反复重试"""
+        entry = self.entries.get(normalize_path(input_path))
+        return (entry is not None
+                and (entry["error"] is None or is_permanent_error(entry["error"]))
+                and entry["mtime"] == stat.st_mtime
+                and entry["size"] == stat.st_size
+                and entry["fingerprint"] == fingerprint)
+
+    def is_up_to_date(self, input_path, stat, fingerprint, output_path):
+        """上次导出成功、源图与参数未变化，且导出文件仍在、大小与记录一致时返回 True"""
+        if not self.is_current(input_path, stat, fingerprint):
+            return False
+        entry = self.entries[normalize_path(input_path)]
+        if entry["error"] is not None or entry["output"] != output_path:
+            return False
+        try:
+            return os.path.getsize(output_path) == entry.get("output_size")
+        except OSError:
+            return False
+
+    def record(self, input_path, stat, fingerprint, output_path, error=None, output_size=None):
+        """更新记录并追加一行日志"""
+        key = normalize_path(input_path)
+        entry = {
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "fingerprint": fingerprint,
+            "output": output_path,
+            "output_size": output_size,
+            "error": error,
+        }
+        self.entries[key] = entry
+        if self._log is None:
+            self._log = open(self.log_path, "a", encoding="utf-8")
+            if self._log.tell() and not _ends_with_newline(self.log_path):
+                self._log.write("\n")  # 结束上次写了一半的行，不与新记录连在一起
+        self._log.write(json.dumps([key, entry], ensure_ascii=False) + "\n")
+        self._log.flush()
+        self.log_lines += 1
+
+
+class IncrementalExport:
+    """增量导出：跳过导出结果仍有效的任务，并把每个结果写入导出清单
+
+    用法：jobs = incremental.select(jobs)，导出后对每个结果调用 incremental.record(result)，最后 save()。
+    skip=False 时不跳过任何任务，只更新清单，供之后的增量导出使用。
+    """
+
+    def __init__(self, output_folder, settings, options, manifest=None, skip=True):
+        self.manifest = manifest or ExportManifest.for_output_folder(output_folder)
+        self.fingerprint = settings_fingerprint(settings, options)
+        self.skip = skip
+        self.skipped = 0
+        self._stats = {}  # 输入路径 -> 导出前的 stat
+
+    def select(self, jobs):
+        """逐个产出需要导出的任务；与导出并行进行，不必先扫描完全部任务"""
+        for job in jobs:
+            try:
+                stat = os.stat(job.input_path)
+            except OSError:
+                yield job  # 交给导出流程报告错误
+                continue
+            if self.skip and self.manifest.is_up_to_date(job.input_path, stat, self.fingerprint, job.output_path):
+                self.skipped += 1
+                continue
+            self._stats[job.input_path] = stat
+            yield job
+
+    def record(self, result):
+        stat = self._stats.pop(result.job.input_path, None)
+        if stat is None:
+            return
+        try:
+            self.manifest.record(result.job.input_path, stat, self.fingerprint, result.job.output_path,
+                                 result.error, result.output_bytes if result.ok else None)
+        except OSError as e:
+            print(f"写入导出清单失败: {e}", file=sys.stderr)
+
+    def save(self):
+        try:
+            self.manifest.save()
+        except OSError as e:
+            print(f"保存导出清单失败: {e}", file=sys.stderr)
@@ -1,18 +1,879 @@
-from PIL import Image
+"""水印渲染引擎（纯 Pillow 实现，不依赖 PyQt5）
+
+GUI 的导出与预览、命令行以及批处理进程都通过这里的函数完成
+尺寸调整、文本水印（描边/阴影）和图片水印的合成。
+"""
+from dataclasses import dataclass, asdict, fields, replace
+from functools import lru_cache
+from PIL import Image, ImageDraw, ImageFilter, ImageFont
+import json
+import math
 import os
+import sys
+
+from compositing import DEFAULT_BACKEND, blend_region, scale_alpha
+from encoders import DEFAULT_PROFILE, encode_image
+
+try:
+    resample_method = Image.Resampling.LANCZOS
+    rotate_method = Image.Resampling.BICUBIC
+except AttributeError:
+    resample_method = Image.LANCZOS
+    rotate_method = Image.BICUBIC
+
+IMAGE_EXTENSIONS = ('.jpeg', '.jpg', '.png', '.bmp', '.tiff')
+
+# 导出尺寸模式，顺序与界面下拉框一致
+SIZE_MODES = ("original", "width", "height", "percent")
+# 图片水印缩放模式，顺序与界面下拉框一致
+IMGWM_SIZE_MODES = ("scale", "width", "height")
+
+# 快速解码时先把图片缩小到不小于目标尺寸的这么多倍，再做最终的 LANCZOS；
+# 与 Image.thumbnail 的默认值相同，结果与直接对原图 LANCZOS 的平均误差在 1~2 个灰阶以内
+FAST_DECODE_GAP = 2.0
+
+THUMBNAIL_SIZE = (100, 100)
+
+WATERMARK_MARGIN = 20
+SHADOW_OFFSET = 2
+
+
+class MemoryBudgetError(MemoryError):
+    """按图片头信息估算的内存占用超过了 ExportOptions.memory_limit_mb"""
+
+
+class WatermarkImageError(Exception):
+    """图片水印文件无法读取（不存在、已损坏等），导出时该图片报告失败"""
+
+
+def logo_error(settings, e):
+    return WatermarkImageError(f"图片水印无法读取: {settings.image_watermark_path} ({type(e).__name__}: {e})")
+
+
+def resource_path(relative_path):
+    """获取资源文件的绝对路径，兼容 PyInstaller 打包后的环境；不依赖当前工作目录"""
+    if hasattr(sys, '_MEIPASS'):
+        return os.path.join(sys._MEIPASS, relative_path)
+    return os.path.join(os.path.dirname(os.path.abspath(__file__)), relative_path)
+
+FONTS_DIR = resource_path("fonts")
+
+
+def get_user_data_path():
+    """获取用户本地数据目录"""
+    if sys.platform == "win32":
+        return os.path.join(os.getenv("APPDATA"), "PhotoWatermarker")
+    else:
+        return os.path.join(os.path.expanduser("~"), ".PhotoWatermarker")
+
+USER_DATA_DIR = get_user_data_path()
+TEMPLATES_FILE = os.path.join(USER_DATA_DIR, "templates.json")
+DEFAULT_TEMPLATES_FILE = resource_path("templates.json")
+
+
+def read_templates(templates_file=None):
+    """读取模板：默认优先用户目录下的 templates.json，其次程序自带的默认模板"""
+    candidates = [templates_file] if templates_file else [TEMPLATES_FILE, DEFAULT_TEMPLATES_FILE]
+    for path in candidates:
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+    return {}
+
+
+@dataclass(frozen=True)
+class WatermarkSettings:
+    """水印参数，字段与 MainWindow.get_current_settings 一致；不可变、可哈希、可跨进程传递"""
+    watermark_text: str = ""
+    font: str = ""
+    font_size: int = 64
+    bold: bool = False
+    italic: bool = False
+    color: tuple = (255, 255, 255)
+    opacity: int = 50
+    shadow: bool = False
+    outline: bool = False
+    outline_width: int = 2
+    outline_color: tuple = (0, 0, 0)
+    image_watermark_path: str = None
+    image_watermark_scale: int = 30
+    image_watermark_opacity: int = 80
+    image_watermark_size_mode: str = "scale"
+    image_watermark_width: int = 200
+    image_watermark_height: int = 100
+    position_mode: str = "right_bottom"
+    custom_pos: tuple = None
+    tile_enabled: bool = False  # 平铺：用重复的水印铺满整幅图片
+    tile_spacing: int = 150  # 平铺时相邻水印的间距（导出像素）
+    tile_stagger: int = 50  # 平铺时隔行错开的距离（单元宽度的百分比）
+    rotation: int = 0  # 逆时针旋转角度（度），单个水印与平铺均适用
+
+    @classmethod
+    def from_dict(cls, data):
+        """由模板字典构造，忽略未知字段；JSON 中的列表转换为元组"""
+        known = {f.name for f in fields(cls)}
+        values = {key: value for key, value in data.items() if key in known}
+        for key in ("color", "outline_color", "custom_pos"):
+            if values.get(key) is not None:
+                values[key] = tuple(values[key])
+        return cls(**values)
+
+    def to_dict(self):
+        return asdict(self)
+
+
+@dataclass(frozen=True)
+class ExportOptions:
+    """导出参数：格式、质量、编码档位、命名规则与尺寸调整"""
+    output_format: str = "jpeg"
+    quality: int = 80
+    encoder_profile: str = DEFAULT_PROFILE  # 见 encoders.ENCODER_PROFILES
+    prefix: str = ""
+    suffix: str = ""
+    size_mode: str = "original"
+    width: int = 800
+    height: int = 600
+    percent: int = 100
+    fast_decode: bool = True
+    memory_limit_mb: int = 0  # 单张图片的内存上限，0 为不限
+    compositing_backend: str = DEFAULT_BACKEND  # 见 compositing.BACKENDS，未安装 NumPy 时 numpy 退回 pillow
+
+    @classmethod
+    def from_dict(cls, data):
+        known = {f.name for f in fields(cls)}
+        return cls(**{key: value for key, value in data.items() if key in known})
+
+    def to_dict(self):
+        return asdict(self)
+
+
+# 随水印模板一起保存的导出参数（模板中与水印参数平铺保存，WatermarkSettings.from_dict 会忽略它们）
+TEMPLATE_EXPORT_KEYS = ("output_format", "quality", "encoder_profile")
+
+
+# ---------- 字体 ----------
+
+FONT_EXTENSIONS = ('.ttf', '.otf', '.ttc')
+FONT_CACHE_SIZE = 64
+
+
+def parse_style(style_name):
+    """由字体表中的样式名（如 "Bold Italic"、"SemiBold Oblique"）判断是否为粗体、斜体"""
+    style = style_name.lower().replace("-", "").replace(" ", "")
+    bold = any(word in style for word in ("bold", "black", "heavy"))
+    italic = "italic" in style or "oblique" in style
+    return bold, italic
+
+
+class FontRegistry:
+    """字体索引：只扫描一次字体文件夹，族名与样式读取自字体表（name 表），而不是文件名
+
+    文件名去掉样式后缀的部分（如 "Calibri"、"csgilbertmonoregulardemo"）作为族名的别名，
+    旧模板中保存的字体名仍能找到对应字体。
+    """
+
+    def __init__(self, folder=FONTS_DIR):
+        self.folder = folder
+        self.styles = {}  # 族名 -> {(粗体, 斜体): 路径}
+        self.aliases = {}  # 小写的族名或别名 -> 族名
+        self._resolved = {}
+        if not os.path.isdir(folder):
+            return
+        for fname in sorted(os.listdir(folder)):
+            if not fname.lower().endswith(FONT_EXTENSIONS):
+                continue
+            path = os.path.join(folder, fname)
+            base_name = os.path.splitext(fname)[0].split('-')[0]
+            try:
+                family, style_name = ImageFont.truetype(path, 12).getname()
+            except Exception:
+                continue
+            family = family or base_name
+            style_name = style_name or ""  # 部分字体的 name 表没有样式名
+            key = parse_style(style_name)
+            styles = self.styles.setdefault(family, {})
+            # 同一样式有多个文件（如 Light 与 Regular）时优先标准样式名
+            if key not in styles or style_name.lower() in ("regular", "bold", "italic", "bold italic"):
+                styles[key] = path
+            self.aliases.setdefault(family.lower(), family)
+            self.aliases.setdefault(base_name.lower(), family)
+
+    @property
+    def families(self):
+        return sorted(self.styles, key=str.lower)
+
+    def canonical_family(self, name):
+        """族名或文件名别名对应的族名，找不到时返回 None"""
+        return self.aliases.get((name or "").lower())
+
+    def resolve(self, name, is_bold, is_italic):
+        """按 粗斜体 -> 粗体 -> 斜体 -> 常规 -> 任意 的顺序选择字体文件，结果缓存"""
+        cache_key = (name, is_bold, is_italic)
+        if cache_key not in self._resolved:
+            self._resolved[cache_key] = self._resolve(name, is_bold, is_italic)
+        return self._resolved[cache_key]
+
+    def _resolve(self, name, is_bold, is_italic):
+        styles = self.styles.get(self.canonical_family(name))
+        if not styles:
+            return None
+        for key in ((is_bold, is_italic), (is_bold, False), (False, is_italic), (False, False)):
+            if key in styles:
+                return styles[key]
+        return next(iter(styles.values()))
+
+
+@lru_cache(maxsize=4)
+def get_font_registry(folder=FONTS_DIR):
+    return FontRegistry(folder)
+
+
+def resolve_font_path(font_name, is_bold, is_italic, registry=None):
+    return (registry or get_font_registry()).resolve(font_name, is_bold, is_italic)
+
+
+@lru_cache(maxsize=FONT_CACHE_SIZE)
+def load_font(font_path, font_size):
+    """加载字体，按 (路径, 字号) 缓存 FreeTypeFont，测量和绘制时不会重复解析字体文件"""
+    try:
+        if font_path:
+            return ImageFont.truetype(font_path, font_size)
+    except Exception:
+        pass
+    return ImageFont.load_default()
+
+
+def measure_text(text, font):
+    """返回文本包围盒 (left, top, right, bottom)，坐标相对绘制原点"""
+    try:
+        return font.getbbox(text)
+    except AttributeError:
+        text_width, text_height = font.getsize(text)
+        return (0, 0, text_width, text_height)
+
+
+# ---------- 尺寸与位置 ----------
+
+def compute_target_size(orig_size, options):
+    """按导出尺寸模式计算目标尺寸，原图模式返回原尺寸"""
+    orig_w, orig_h = orig_size
+    if options.size_mode == "width":
+        return options.width, int(orig_h * (options.width / orig_w))
+    if options.size_mode == "height":
+        return int(orig_w * (options.height / orig_h)), options.height
+    if options.size_mode == "percent":
+        scale = options.percent / 100.0
+        return int(orig_w * scale), int(orig_h * scale)
+    return orig_w, orig_h
+
+
+def prepare_decode(img, options):
+    """计算导出尺寸；fast_decode 时对尚未解码的 JPEG 启用 DCT 缩放解码（只改变 img.size，不立即解码），返回导出尺寸"""
+    target_size = compute_target_size(img.size, options)
+    if options.size_mode not in SIZE_MODES[1:] or not options.fast_decode:
+        return target_size
+    draft_size = (int(target_size[0] * FAST_DECODE_GAP), int(target_size[1] * FAST_DECODE_GAP))
+    if img.format == "JPEG" and draft_size[0] < img.width and draft_size[1] < img.height:
+        # draft 只在图片尚未 load 时生效，解码结果不小于 draft_size
+        img.draft(img.mode, draft_size)
+    return target_size
+
+
+def resize_image(img, options, target_size=None):
+    """按导出尺寸缩放；fast_decode 时对尚未解码的 JPEG 启用 DCT 缩放解码，其余格式先整数倍 reduce()
+
+    已调用 prepare_decode 时传入其返回的 target_size。
+    """
+    if options.size_mode not in SIZE_MODES[1:]:
+        return img
+    if target_size is None:
+        target_size = prepare_decode(img, options)
+    if not options.fast_decode:
+        return img.resize(target_size, resample=resample_method)
+    return img.resize(target_size, resample=resample_method, reducing_gap=FAST_DECODE_GAP)
+
+
+def bytes_per_pixel(mode):
+    """Pillow 内部每像素占用的字节数（RGB 等多通道模式按 4 字节存放）"""
+    if mode in ("1", "L", "P"):
+        return 1
+    if mode.startswith("I;16"):
+        return 2
+    return 4
+
+
+def estimate_memory(decode_size, mode, target_size, options):
+    """估算处理一张图片的峰值内存（字节）：解码帧 + 缩放结果 + 必要的模式转换
+
+    水印区域通常只占画面很小一部分，不计入。
+    """
+    peak = decode_size[0] * decode_size[1] * bytes_per_pixel(mode)
+    target_pixels = target_size[0] * target_size[1]
+    if options.size_mode in SIZE_MODES[1:]:
+        peak += target_pixels * bytes_per_pixel(mode)
+    if mode not in ("RGB", "RGBA") or (mode == "RGBA" and options.output_format.lower() == "jpeg"):
+        peak += target_pixels * 4
+    return peak
+
+
+def check_memory_budget(img, target_size, options):
+    """在解码前按图片头信息检查内存上限，超出时抛出 MemoryBudgetError"""
+    if options.memory_limit_mb <= 0:
+        return
+    needed = estimate_memory(img.size, img.mode, target_size, options)
+    if needed > options.memory_limit_mb * 1024 * 1024:
+        raise MemoryBudgetError(
+            f"预计需要 {needed / (1024 * 1024):.0f} MB 内存，超过上限 {options.memory_limit_mb} MB"
+        )
+
+
+def check_file_budget(input_path, options):
+    """只读取图片头信息检查内存上限，不解码、不把文件读入内存"""
+    if options.memory_limit_mb <= 0:
+        return
+    with Image.open(input_path) as img:
+        check_memory_budget(img, prepare_decode(img, options), options)
+
+
+def get_watermark_pos(img_size, wm_size, position_mode="right_bottom", custom_pos=None):
+    """九宫格/自定义坐标，custom_pos 为相对图片尺寸的百分比"""
+    if custom_pos:
+        x_percent, y_percent = custom_pos
+        return int(x_percent * img_size[0]), int(y_percent * img_size[1])
+    W, H = img_size
+    w, h = wm_size
+    margin = WATERMARK_MARGIN
+    pos_map = {
+        "left_top": (margin, margin),
+        "center_top": ((W - w) // 2, margin),
+        "right_top": (W - w - margin, margin),
+        "left_center": (margin, (H - h) // 2),
+        "center": ((W - w) // 2, (H - h) // 2),
+        "right_center": (W - w - margin, (H - h) // 2),
+        "left_bottom": (margin, H - h - margin),
+        "center_bottom": ((W - w) // 2, H - h - margin),
+        "right_bottom": (W - w - margin, H - h - margin),
+    }
+    return pos_map.get(position_mode, (W - w - margin, H - h - margin))
+
+
+def image_watermark_size(logo_size, img_size, settings):
+    """按图片水印缩放方式计算 logo 的目标尺寸"""
+    logo_w, logo_h = logo_size
+    mode = settings.image_watermark_size_mode
+    if mode == "scale":
+        new_w = int(img_size[0] * settings.image_watermark_scale / 100.0)
+        new_h = int(logo_h * (new_w / logo_w))
+    elif mode == "width":
+        new_w = settings.image_watermark_width
+        new_h = int(logo_h * (new_w / logo_w))
+    elif mode == "height":
+        new_h = settings.image_watermark_height
+        new_w = int(logo_w * (new_h / logo_h))
+    else:
+        new_w, new_h = logo_w, logo_h
+    return new_w, new_h
+
+
+def get_watermark_size(settings, img_size):
+    """估算当前水印大小（图片水印优先，其次文本；旋转后取外接矩形），用于预览中的拖拽命中判断"""
+    if settings.image_watermark_path:
+        try:
+            return rotated_size(image_watermark_size(get_logo(settings).size, img_size, settings), settings.rotation)
+        except Exception:
+            pass
+    if settings.watermark_text:
+        try:
+            return rotated_size(get_text_size(settings), settings.rotation)
+        except Exception:
+            return 100, 40
+    return 60, 40
+
+
+def get_watermark_bounds(settings, img_size):
+    """水印在导出坐标下的可见范围 (x, y, 宽, 高)，包含描边、阴影与旋转，只做测量不渲染
+
+    与 get_watermark_size 选择同一个水印（图片水印优先，其次文本），用于预览中的命中判断。
+    """
+    size = None
+    box = None
+    if settings.image_watermark_path:
+        try:
+            size = image_watermark_size(get_logo(settings).size, img_size, settings)
+            box = (0, 0, size[0], size[1])
+        except Exception:
+            size = None
+    if size is None and settings.watermark_text:
+        try:
+            metrics = get_text_metrics(settings)
+            size = metrics.size
+            # 绘制原点即定位点，可见范围相对定位框偏移 bbox 的左上角
+            box = metrics.extent
+        except Exception:
+            pass
+    if size is None:
+        size = (60, 40)
+        box = (0, 0, 60, 40)
+    x, y = get_watermark_pos(img_size, rotated_size(size, settings.rotation), settings.position_mode, settings.custom_pos)
+    left, top, right, bottom = rotate_box(box, size, settings.rotation)
+    return x + left, y + top, right - left, bottom - top
+
+
+# ---------- 合成 ----------
+
+@dataclass(frozen=True, eq=False)
+class Stamp:
+    """预渲染的水印图块；按对象身份比较和哈希，可作为缓存键
+
+    image: 紧贴水印内容的 RGBA 图块
+    offset: 图块左上角相对水印定位点的偏移（定位点由 get_watermark_pos 计算）
+    size: 参与九宫格定位的水印尺寸
+    """
+    image: Image.Image
+    offset: tuple
+    size: tuple
+
+
+def draw_outlined_text(draw, xy, text, font, fill, outline_width, outline_color):
+    """单次绘制带描边的文本：描边由字形蒙版一次性扩张得到，耗时与描边宽度基本无关"""
+    if isinstance(font, ImageFont.FreeTypeFont):
+        draw.text(xy, text, font=font, fill=fill, stroke_width=outline_width, stroke_fill=outline_color)
+    else:
+        # 位图字体会忽略 stroke_width（不报错），改为对字形蒙版做一次最大值滤波
+        mask = Image.new("L", draw.im.size, 0)
+        ImageDraw.Draw(mask).text(xy, text, font=font, fill=255)
+        stroke = mask.filter(ImageFilter.MaxFilter(2 * outline_width + 1))
+        draw.bitmap((0, 0), stroke, fill=outline_color)
+        draw.text(xy, text, font=font, fill=fill)
+
+
+@dataclass(frozen=True)
+class TextMetrics:
+    """文本水印的几何信息，坐标相对绘制原点（即水印定位点）
+
+    bbox: 字形包围盒 (left, top, right, bottom)
+    pad_before / pad_after: 描边向左上、描边与阴影向右下扩展的像素数
+    """
+    bbox: tuple
+    pad_before: int
+    pad_after: int
+
+    @property
+    def size(self):
+        """参与九宫格定位的尺寸（不含描边和阴影）"""
+        return self.bbox[2] - self.bbox[0], self.bbox[3] - self.bbox[1]
+
+    @property
+    def extent(self):
+        """包含描边和阴影的可见范围 (left, top, right, bottom)"""
+        return (self.bbox[0] - self.pad_before, self.bbox[1] - self.pad_before,
+                self.bbox[2] + self.pad_after, self.bbox[3] + self.pad_after)
+
+
+@lru_cache(maxsize=256)
+def text_metrics(text, font_path, font_size, outline_width=0, shadow_offset=0):
+    """按 (文本, 字体, 字号, 描边宽度, 阴影偏移) 缓存的文本几何信息，只测量不绘制；无描边/阴影时对应参数传 0"""
+    bbox = measure_text(text, load_font(font_path, font_size))
+    outline_width = max(0, outline_width)
+    return TextMetrics(tuple(bbox), outline_width, max(outline_width, shadow_offset))
+
+
+@lru_cache(maxsize=32)
+def render_text_stamp(text, font_path, font_size, color, opacity, shadow, outline, outline_width=2, outline_color=(0, 0, 0),
+                      shadow_offset=SHADOW_OFFSET):
+    """渲染文本水印（阴影、描边、正文）到紧贴包围盒的图块，批量导出时同一模板只渲染一次"""
+    font = load_font(font_path, font_size)
+    outline_width = max(0, outline_width) if outline else 0
+    metrics = text_metrics(text, font_path, font_size, outline_width, shadow_offset if shadow else 0)
+    left, top, right, bottom = metrics.extent
+    tile = Image.new("RGBA", (right - left, bottom - top), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(tile)
+    # 文本绘制原点在图块中的位置
+    x = -left
+    y = -top
+    alpha = int(255 * (opacity / 100))
+    if shadow:
+        draw.text((x + shadow_offset, y + shadow_offset), text, font=font, fill=(0, 0, 0, alpha))
+    if outline_width:
+        draw_outlined_text(draw, (x, y), text, font, (*color, alpha), outline_width, (*outline_color, alpha))
+    else:
+        draw.text((x, y), text, font=font, fill=(*color, alpha))
+    return Stamp(tile, (left, top), metrics.size)
+
+
+def scale_length(value, scale):
+    """把导出坐标下的长度换算到缩小的画布上，非零长度至少保留 1 像素"""
+    if scale == 1 or not value:
+        return value
+    return max(1, int(round(value * scale)))
+
+
+def get_text_stamp(settings, scale=1.0):
+    font_path = resolve_font_path(settings.font, settings.bold, settings.italic)
+    return render_text_stamp(settings.watermark_text, font_path, scale_length(settings.font_size, scale),
+                             tuple(settings.color), settings.opacity, settings.shadow, settings.outline,
+                             scale_length(settings.outline_width, scale), tuple(settings.outline_color),
+                             scale_length(SHADOW_OFFSET, scale))
+
+
+def get_text_metrics(settings):
+    """导出坐标下的文本几何信息，与 get_text_stamp(settings) 渲染出的图块一致"""
+    font_path = resolve_font_path(settings.font, settings.bold, settings.italic)
+    return text_metrics(settings.watermark_text, font_path, settings.font_size,
+                        settings.outline_width if settings.outline else 0, SHADOW_OFFSET if settings.shadow else 0)
+
+
+def get_text_size(settings):
+    """文本水印在导出坐标下参与定位的尺寸"""
+    return get_text_metrics(settings).size
+
+
+def rotated_size(size, angle):
+    """宽高为 size 的矩形绕中心逆时针旋转 angle 度后的外接矩形尺寸"""
+    if not angle % 360:
+        return tuple(size)
+    radians = math.radians(angle)
+    cos = abs(math.cos(radians))
+    sin = abs(math.sin(radians))
+    return (int(math.ceil(size[0] * cos + size[1] * sin - 1e-6)),
+            int(math.ceil(size[0] * sin + size[1] * cos - 1e-6)))
+
+
+def rotate_point(point, size, angle):
+    """把相对定位点的坐标换算到绕定位框（宽高 size）中心逆时针旋转 angle 度后的坐标系
+
+    旋转后的定位点是旋转后定位框外接矩形的左上角；y 轴向下。
+    """
+    new_size = rotated_size(size, angle)
+    radians = math.radians(angle)
+    cos = math.cos(radians)
+    sin = math.sin(radians)
+    vx = point[0] - size[0] / 2
+    vy = point[1] - size[1] / 2
+    return new_size[0] / 2 + vx * cos + vy * sin, new_size[1] / 2 - vx * sin + vy * cos
+
+
+def rotate_box(box, size, angle):
+    """相对定位点的矩形 (left, top, right, bottom) 旋转后的外接矩形"""
+    if not angle % 360:
+        return tuple(box)
+    corners = [rotate_point((x, y), size, angle) for x in (box[0], box[2]) for y in (box[1], box[3])]
+    xs = [corner[0] for corner in corners]
+    ys = [corner[1] for corner in corners]
+    return (int(math.floor(min(xs))), int(math.floor(min(ys))), int(math.ceil(max(xs))), int(math.ceil(max(ys))))
+
+
+@lru_cache(maxsize=32)
+def rotate_stamp(stamp, angle):
+    """绕定位框中心逆时针旋转图块，按 (图块, 角度) 缓存
+
+    返回的 Stamp 以旋转后定位框的外接矩形参与定位，拖动角度滑块时只旋转水印图块本身。
+    """
+    if not angle % 360:
+        return stamp
+    image = stamp.image.rotate(angle, resample=rotate_method, expand=True)
+    # 图块中心随定位框一起旋转
+    center = (stamp.offset[0] + stamp.image.width / 2, stamp.offset[1] + stamp.image.height / 2)
+    center_x, center_y = rotate_point(center, stamp.size, angle)
+    offset = (int(round(center_x - image.width / 2)), int(round(center_y - image.height / 2)))
+    return Stamp(image, offset, rotated_size(stamp.size, angle))
+
+
+def stamp_box(img_size, stamp, pos):
+    """图块落在画面内的部分，返回 (画面中的左上角, 图块裁剪框)；完全在画面外时返回 None"""
+    left = pos[0] + stamp.offset[0]
+    top = pos[1] + stamp.offset[1]
+    tile = stamp.image
+    crop_box = (max(0, -left), max(0, -top),
+                min(tile.width, img_size[0] - left), min(tile.height, img_size[1] - top))
+    if crop_box[0] >= crop_box[2] or crop_box[1] >= crop_box[3]:
+        return None
+    return (left + crop_box[0], top + crop_box[1]), crop_box
+
+
+def clipped_tile(stamp, crop_box):
+    tile = stamp.image
+    if crop_box != (0, 0, tile.width, tile.height):
+        tile = tile.crop(crop_box)
+    return tile
+
+
+def composite_region(img, stamp, pos, backend=None):
+    """只合成图块覆盖的区域：裁出该区域合成后贴回，区域外的像素不做转换和复制
+
+    img 为 RGB 或 RGBA，就地修改；合成内核见 compositing.blend_region。
+    """
+    box = stamp_box(img.size, stamp, pos)
+    if box is None:
+        return img
+    dest, crop_box = box
+    return blend_region(img, clipped_tile(stamp, crop_box), dest, backend)
+
+
+@lru_cache(maxsize=8)
+def load_logo(path, mtime):
+    """解码图片水印并转为 RGBA，按 (路径, 修改时间) 缓存，文件被修改后自动重新读取"""
+    with Image.open(path) as wm_img:
+        return wm_img.convert("RGBA")
+
+
+@lru_cache(maxsize=32)
+def render_logo_stamp(path, mtime, size, opacity, backend=None):
+    """缩放并应用透明度后的图片水印，按 (路径, 修改时间, 目标尺寸, 透明度, 合成实现) 缓存"""
+    wm_img = load_logo(path, mtime).resize(size, resample=resample_method)
+    if opacity < 100:
+        wm_img = scale_alpha(wm_img, opacity, backend)
+    return Stamp(wm_img, (0, 0), size)
+
+
+def get_logo(settings):
+    path = settings.image_watermark_path
+    return load_logo(path, os.path.getmtime(path))
+
+
+def get_logo_stamp(settings, size, backend=None):
+    """取 size 大小的图片水印图块"""
+    path = settings.image_watermark_path
+    return render_logo_stamp(path, os.path.getmtime(path), tuple(size), settings.image_watermark_opacity, backend)
+
+
+def layout_stamps(settings, img_size, scale=1.0, backend=None):
+    """计算需要合成的水印图块及其定位点，返回 [(Stamp, (x, y)), ...]
+
+    img_size 为导出尺寸；scale 为实际画布相对导出尺寸的比例（预览代理图小于 1）。
+    定位先在导出坐标中完成再换算，预览与导出的水印位置保持一致；旋转后按外接矩形定位。
+    """
+    placed = []
+    angle = settings.rotation
+    if settings.watermark_text:
+        stamp = get_text_stamp(settings, scale)
+        size = stamp.size if scale == 1 else get_text_size(settings)
+        x, y = get_watermark_pos(img_size, rotated_size(size, angle), settings.position_mode, settings.custom_pos)
+        placed.append((rotate_stamp(stamp, angle), (int(x * scale), int(y * scale))))
+    if settings.image_watermark_path:
+        try:
+            size = image_watermark_size(get_logo(settings).size, img_size, settings)
+            stamp = get_logo_stamp(settings, (scale_length(size[0], scale), scale_length(size[1], scale)), backend)
+            x, y = get_watermark_pos(img_size, rotated_size(size, angle), settings.position_mode, settings.custom_pos)
+        except Exception as e:
+            raise logo_error(settings, e) from e
+        placed.append((rotate_stamp(stamp, angle), (int(x * scale), int(y * scale))))
+    return placed
+
+
+# ---------- 平铺 ----------
+
+@dataclass(frozen=True)
+class PatternTile:
+    """平铺图案的一个周期：image 可无缝重复拼接，左上角是一个完整单元，unit_size 为单元（旋转后）的尺寸"""
+    image: Image.Image
+    unit_size: tuple
+
+
+def merge_stamps(stamps):
+    """把定位点相同的多个图块（如文本与图片水印）合成为一个图块，offset 仍相对该定位点"""
+    boxes = [(stamp.offset[0], stamp.offset[1], stamp.offset[0] + stamp.image.width, stamp.offset[1] + stamp.image.height)
+             for stamp in stamps]
+    left = min(box[0] for box in boxes)
+    top = min(box[1] for box in boxes)
+    image = Image.new("RGBA", (max(box[2] for box in boxes) - left, max(box[3] for box in boxes) - top), (0, 0, 0, 0))
+    for stamp, box in zip(stamps, boxes):
+        image.alpha_composite(stamp.image, (box[0] - left, box[1] - top))
+    size = (max(stamp.size[0] for stamp in stamps), max(stamp.size[1] for stamp in stamps))
+    return Stamp(image, (left, top), size)
+
+
+@lru_cache(maxsize=8)
+def render_pattern_tile(settings, logo_size, scale, logo_mtime, backend=None):
+    """预渲染平铺图案的一个周期（含隔行错位），按 (水印参数, 图片水印尺寸, 画布比例) 缓存
+
+    logo_size 为导出坐标下的图片水印尺寸，没有图片水印时为 None；logo_mtime 用于文件修改后失效。
+    返回 PatternTile，没有可平铺的内容时返回 None。
+    """
+    stamps = []
+    if settings.watermark_text:
+        stamps.append(get_text_stamp(settings, scale))
+    if logo_size:
+        stamps.append(get_logo_stamp(settings, (scale_length(logo_size[0], scale), scale_length(logo_size[1], scale)),
+                                     backend))
+    if not stamps:
+        return None
+    # 文本与图片水印按单个水印时的相对位置（同一定位点）合成为一个平铺单元
+    unit = merge_stamps(stamps).image
+    if settings.rotation % 360:
+        unit = unit.rotate(settings.rotation, resample=rotate_method, expand=True)
+    spacing = max(0, int(round(settings.tile_spacing * scale)))
+    cell_w = unit.width + spacing
+    cell_h = unit.height + spacing
+    shift = int(cell_w * (settings.tile_stagger % 100) / 100)
+    rows = 2 if shift else 1
+    tile = Image.new("RGBA", (cell_w, cell_h * rows), (0, 0, 0, 0))
+    tile.paste(unit, (0, 0))
+    if shift:
+        # 错开的一行超出图块右边的部分从左边绕回，保证图块可以无缝拼接
+        tile.paste(unit, (shift, cell_h))
+        tile.paste(unit, (shift - cell_w, cell_h))
+    return PatternTile(tile, unit.size)
+
+
+def get_pattern_tile(settings, img_size, scale=1.0, backend=None):
+    logo_size = None
+    logo_mtime = None
+    if settings.image_watermark_path:
+        try:
+            logo_size = image_watermark_size(get_logo(settings).size, img_size, settings)
+            logo_mtime = os.path.getmtime(settings.image_watermark_path)
+        except Exception as e:
+            raise logo_error(settings, e) from e
+    return render_pattern_tile(settings, logo_size, scale, logo_mtime, backend)
+
+
+def fill_pattern(img, tile, origin=(0, 0), backend=None):
+    """用图案图块（RGBA 图片）铺满画面，origin 为某个图块左上角的位置；就地修改 img
+
+    先把图块横向拼成一条，再逐条合成，不会产生整幅的 RGBA 图层。
+    """
+    strip = Image.new("RGBA", (img.width + tile.width, tile.height), (0, 0, 0, 0))
+    for x in range(0, strip.width, tile.width):
+        strip.paste(tile, (x, 0))
+    start_x = -origin[0] % tile.width
+    band = strip.crop((start_x, 0, start_x + img.width, tile.height))
+    y = origin[1] % tile.height
+    if y > 0:
+        y -= tile.height
+    while y < img.height:
+        top = max(0, y)
+        bottom = min(img.height, y + tile.height)
+        piece = band if (top - y, bottom - y) == (0, tile.height) else band.crop((0, top - y, img.width, bottom - y))
+        blend_region(img, piece, (0, top), backend)
+        y += tile.height
+    return img
+
+
+def apply_pattern(img, settings, logical_size, backend=None):
+    """平铺水印：一个单元位于画面中心，其余按间距和错位向四周重复"""
+    pattern = get_pattern_tile(settings, logical_size, img.width / logical_size[0], backend)
+    if pattern is None:
+        return img
+    unit_w, unit_h = pattern.unit_size
+    return fill_pattern(img, pattern.image, ((img.width - unit_w) // 2, (img.height - unit_h) // 2), backend)
+
+
+def apply_watermark(img, settings, logical_size=None, backend=None):
+    """对已调整尺寸的图片合成全部水印，返回 RGB 或 RGBA 图片
+
+    只转换和合成水印覆盖的区域：RGB 图片保持 RGB，RGB/RGBA 图片就地修改，其他模式先转换。
+    logical_size 为导出尺寸，img 是其缩小版（如预览代理图）时传入，默认等于 img.size。
+    backend 为合成实现（见 compositing.BACKENDS），默认 Pillow。
+    """
+    logical_size = logical_size or img.size
+    scale = img.width / logical_size[0]
+    if img.mode not in ("RGB", "RGBA"):
+        has_alpha = "A" in img.getbands() or "transparency" in img.info
+        img = img.convert("RGBA" if has_alpha else "RGB")
+    if settings.tile_enabled:
+        return apply_pattern(img, settings, logical_size, backend)
+    for stamp, pos in layout_stamps(settings, logical_size, scale, backend):
+        composite_region(img, stamp, pos, backend)
+    return img
+
+
+def render_image(input_path, settings, options):
+    """读取、缩放并加水印，返回 RGB 或 RGBA 图片；设置了内存上限时先按图片头信息检查"""
+    with Image.open(input_path) as source:
+        target_size = prepare_decode(source, options)
+        check_memory_budget(source, target_size, options)
+        img = resize_image(source, options, target_size)
+        if img is not source:
+            source.close()  # 缩放后立即释放原图的解码帧，再合成水印
+        else:
+            img.load()  # 原尺寸导出时没有水印可合成也要在文件关闭前解码，否则保存时读不到数据
+        return apply_watermark(img, settings, backend=options.compositing_backend)
+
+
+def load_thumbnail(path, size=THUMBNAIL_SIZE):
+    """生成缩略图，返回 RGBA 图片；thumbnail() 会先对 JPEG 做 draft（DCT 缩放解码，最多 1/8），只解码所需分辨率"""
+    with Image.open(path) as img:
+        img.thumbnail(size, resample=resample_method)
+        return img.convert("RGBA")
+
+
+@lru_cache(maxsize=4)
+def load_preview_source(path, mtime, max_size):
+    """把原图一次性解码为不超过 max_size 的 RGBA 代理图（JPEG 使用 draft 缩放解码），返回 (代理图, 原图尺寸)"""
+    with Image.open(path) as img:
+        orig_size = img.size
+        img.thumbnail(max_size, resample=resample_method)
+        return img.convert("RGBA"), orig_size
+
+
+def get_preview_base(path, options, max_size):
+    """不含水印的预览底图（代理图的副本，可就地修改），返回 (底图, 导出尺寸)
+
+    代理图按 (路径, 修改时间) 缓存，调整水印参数时不再重新解码原图。
+    """
+    source, orig_size = load_preview_source(path, os.path.getmtime(path), tuple(max_size))
+    logical_size = compute_target_size(orig_size, options)
+    scale = min(1.0, max_size[0] / logical_size[0], max_size[1] / logical_size[1])
+    proxy_size = (max(1, int(round(logical_size[0] * scale))), max(1, int(round(logical_size[1] * scale))))
+    base = source.copy() if source.size == proxy_size else source.resize(proxy_size, resample=resample_method)
+    return base, logical_size
+
+
+def without_logo(settings):
+    return replace(settings, image_watermark_path=None)
+
+
+def render_preview(path, settings, options, max_size):
+    """在显示分辨率的代理图上渲染预览，返回 (预览图, 导出尺寸)"""
+    base, logical_size = get_preview_base(path, options, max_size)
+    try:
+        return apply_watermark(base, settings, logical_size, options.compositing_backend), logical_size
+    except WatermarkImageError:
+        # 合成前就已定位全部图块，底图未被修改；预览时只显示其余水印，导出时该图片报告失败
+        return apply_watermark(base, without_logo(settings), logical_size, options.compositing_backend), logical_size
+
+
+def render_drag_layers(path, settings, options, max_size):
+    """拖拽预览用的分层结果，返回 (不含水印的底图, 全部水印合成的图块, 导出尺寸)
+
+    settings 应为自定义位置（所有水印共用 custom_pos 定位点）；图块 offset 以底图像素计、相对定位点。
+    拖拽时界面只需移动图块，松开鼠标后再完整合成。
+    """
+    base, logical_size = get_preview_base(path, options, max_size)
+    scale = base.width / logical_size[0]
+    try:
+        placed = layout_stamps(settings, logical_size, scale, options.compositing_backend)
+    except WatermarkImageError:
+        placed = layout_stamps(without_logo(settings), logical_size, scale, options.compositing_backend)
+    stamps = [stamp for stamp, _ in placed]
+    return base, merge_stamps(stamps) if stamps else None, logical_size
+
+
+def save_image(img, output_path, options):
+    encode_image(img, output_path, options.output_format, options.quality, options.encoder_profile)
+
+
+def get_output_path(input_path, output_folder, options):
+    """按前缀/后缀规则生成导出文件路径"""
+    base_name, _ = os.path.splitext(os.path.basename(input_path))
+    prefix = options.prefix
+    output_name = f"{prefix + '_' if prefix else ''}{base_name}{options.suffix}.{options.output_format.lower()}"
+    return os.path.join(output_folder, output_name)
+
+
+def process_image(input_path, output_path, settings, options):
+    img = render_image(input_path, settings, options)
+    save_image(img, output_path, options)
+    return output_path
+
 
-def process_images(image_paths, output_folder, prefix="", suffix="", quality=80, resize=None, output_format="JPEG"):
+def process_images(image_paths, output_folder, settings=None, options=None):
+    """批量导出，返回导出文件路径列表"""
+    settings = settings or WatermarkSettings()
+    options = options or ExportOptions()
+    outputs = []
     for image_path in image_paths:
-        with Image.open(image_path) as img:
-            # 调整尺寸
-            if resize:
-                img = img.resize(resize)
-
-            # 设置输出文件名
-            base_name = os.path.basename(image_path)
-            name, ext = os.path.splitext(base_name)
-            new_name = f"{prefix}{name}{suffix}.{output_format.lower()}"
-            output_path = os.path.join(output_folder, new_name)
-
-            # 保存图片
-            img.save(output_path, format=output_format, quality=quality if output_format == "JPEG" else None)
+        output_path = get_output_path(image_path, output_folder, options)
+        outputs.append(process_image(image_path, output_path, settings, options))
+    return outputs
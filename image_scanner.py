@@ -0,0 +1,109 @@
+"""流式扫描图片文件
+
+用 os.scandir 遍历目录，边扫描边分批产出路径，调用方可以立即开始显示或处理；
+按规范化路径（可选按 inode）去重，支持包含/排除的通配规则。
+"""
+from fnmatch import fnmatch
+import os
+import time
+
+from image_processor import IMAGE_EXTENSIONS
+
+DEFAULT_INCLUDE = tuple(f"*{ext}" for ext in IMAGE_EXTENSIONS)
+
+
+def normalize_path(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
+def match_any(path, patterns):
+    """通配规则可以匹配文件名，也可以匹配完整路径；大小写不敏感"""
+    name = os.path.basename(path).lower()
+    path = path.replace(os.sep, "/").lower()
+    return any(fnmatch(name, pattern.lower()) or fnmatch(path, pattern.lower()) for pattern in patterns)
+
+
+class PathDeduplicator:
+    """记录已出现的路径；dedupe_inodes 时同一文件的硬链接/符号链接也只保留一个"""
+
+    def __init__(self, dedupe_inodes=False):
+        self.dedupe_inodes = dedupe_inodes
+        self.paths = set()
+        self.inodes = set()
+
+    def add(self, path, stat=None):
+        """首次出现返回 True"""
+        key = normalize_path(path)
+        if key in self.paths:
+            return False
+        if self.dedupe_inodes:
+            try:
+                stat = stat or os.stat(path)
+            except OSError:
+                stat = None
+            if stat is not None and stat.st_ino:
+                inode = (stat.st_dev, stat.st_ino)
+                if inode in self.inodes:
+                    return False
+                self.inodes.add(inode)
+        self.paths.add(key)
+        return True
+
+
+def iter_image_files(roots, include=DEFAULT_INCLUDE, exclude=(), follow_symlinks=False):
+    """逐个产出 roots（文件或文件夹）下匹配的文件路径，产出 (路径, os.DirEntry 或 None)"""
+    include = include or DEFAULT_INCLUDE
+    exclude = exclude or ()
+    for root in roots:
+        if os.path.isfile(root):
+            if match_any(root, include) and not match_any(root, exclude):
+                yield root, None
+            continue
+        stack = [root]
+        while stack:
+            folder = stack.pop()
+            try:
+                entries = os.scandir(folder)
+            except OSError:
+                continue
+            subfolders = []
+            with entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=follow_symlinks):
+                            if not match_any(entry.path, exclude):
+                                subfolders.append(entry.path)
+                        elif entry.is_file(follow_symlinks=True):
+                            if match_any(entry.path, include) and not match_any(entry.path, exclude):
+                                yield entry.path, entry
+                    except OSError:
+                        continue
+            # 倒序入栈，保持按目录顺序深度优先
+            stack.extend(sorted(subfolders, reverse=True))
+
+
+def scan_images(roots, include=DEFAULT_INCLUDE, exclude=(), batch_size=256, dedupe_inodes=False, deduplicator=None,
+                flush_interval=0.25):
+    """分批产出去重后的图片路径列表
+
+    每批最多 batch_size 个；距上一批超过 flush_interval 秒时即使未满也先产出，慢速网络盘上也能尽快看到结果。
+    传入 deduplicator 可以跨多次扫描去重（例如界面中已导入的图片）。
+    """
+    deduplicator = deduplicator or PathDeduplicator(dedupe_inodes)
+    batch = []
+    last_flush = time.monotonic()
+    for path, entry in iter_image_files(roots, include, exclude):
+        stat = None
+        if deduplicator.dedupe_inodes and entry is not None:
+            try:
+                stat = entry.stat()
+            except OSError:
+                pass
+        if deduplicator.add(path, stat):
+            batch.append(path)
+            if len(batch) >= batch_size or time.monotonic() - last_flush >= flush_interval:
+                yield batch
+                batch = []
+                last_flush = time.monotonic()
+    if batch:
+        yield batch
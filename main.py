@@ -1,8 +1,10 @@
 import sys
+import multiprocessing
 from PyQt5.QtWidgets import QApplication
 from ui_main import MainWindow
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # 打包后并行导出的子进程需要
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
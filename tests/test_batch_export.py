@@ -0,0 +1,67 @@
+import pytest
+from PIL import Image
+
+from batch_export import STAGES, build_jobs, export_pipelined
+from image_processor import ExportOptions, WatermarkSettings
+
+
+def make_images(tmp_path, count):
+    paths = []
+    for i in range(count):
+        path = tmp_path / f"{i}.png"
+        Image.new("RGB", (32, 24), (i * 10, 0, 0)).save(path)
+        paths.append(str(path))
+    return paths
+
+
+def make_jobs(tmp_path, paths, options=ExportOptions()):
+    output = tmp_path / "out"
+    output.mkdir(exist_ok=True)
+    return build_jobs(paths, str(output), WatermarkSettings(watermark_text="x"), options)
+
+
+def test_results_keep_job_order(tmp_path):
+    paths = make_images(tmp_path, 6)
+    paths.insert(2, str(tmp_path / "missing.png"))
+    results = list(export_pipelined(make_jobs(tmp_path, paths), queue_size=1))
+    assert [result.index for result in results] == list(range(len(paths)))
+    assert [result.job.input_path for result in results] == paths
+    assert [result.ok for result in results] == [True, True, False, True, True, True, True]
+    assert set(results[0].stage_times) == set(STAGES)
+    assert list(results[2].stage_times) == ["read"]  # 读取失败后不再执行后续阶段
+
+
+def test_memory_limit_mode_keeps_order(tmp_path):
+    paths = make_images(tmp_path, 4)
+    results = list(export_pipelined(make_jobs(tmp_path, paths, ExportOptions(memory_limit_mb=64))))
+    assert [result.job.input_path for result in results] == paths
+    assert all(result.ok for result in results)
+
+
+def test_generator_error_is_reraised(tmp_path):
+    paths = make_images(tmp_path, 2)
+
+    def jobs():
+        yield from make_jobs(tmp_path, paths)
+        raise OSError("scan failed")
+
+    results = []
+    with pytest.raises(OSError, match="scan failed"):
+        for result in export_pipelined(jobs()):
+            results.append(result)
+    assert len(results) == 2
+
+
+def test_early_close_stops_reading(tmp_path):
+    paths = make_images(tmp_path, 3)
+    taken = []
+
+    def jobs():
+        for job in make_jobs(tmp_path, paths * 20):
+            taken.append(job)
+            yield job
+
+    results = export_pipelined(jobs(), queue_size=1)
+    next(results)
+    results.close()
+    assert len(taken) < len(paths) * 20
@@ -0,0 +1,41 @@
+from PIL import Image, ImageDraw, ImageFont
+
+from image_processor import ExportOptions, WatermarkSettings, draw_outlined_text, process_image
+
+
+def test_export_without_watermark(tmp_path):
+    """没有任何水印可合成时，原尺寸导出仍能保存（原图须在文件关闭前解码）"""
+    source = tmp_path / "a.jpg"
+    output = tmp_path / "o.jpg"
+    Image.new("RGB", (64, 48), (200, 100, 50)).save(source)
+    process_image(str(source), str(output), WatermarkSettings(watermark_text=""), ExportOptions())
+    with Image.open(output) as img:
+        assert img.size == (64, 48)
+
+
+def test_bitmap_font_outline_is_drawn():
+    """位图字体会忽略 stroke_width，描边须由最大值滤波得到"""
+    font = ImageFont.load_default_imagefont()
+    plain = Image.new("RGBA", (80, 30), (0, 0, 0, 0))
+    ImageDraw.Draw(plain).text((10, 10), "Hi", font=font, fill=(255, 255, 255, 255))
+    outlined = Image.new("RGBA", (80, 30), (0, 0, 0, 0))
+    draw_outlined_text(ImageDraw.Draw(outlined), (10, 10), "Hi", font, (255, 255, 255, 255), 3, (0, 0, 0, 255))
+    left, top, right, bottom = plain.getbbox()
+    assert outlined.getbbox() == (left - 3, top - 3, right + 3, bottom + 3)
+
+
+def test_font_without_style_name(tmp_path, monkeypatch):
+    """name 表中没有样式名的字体不应使字体索引失败"""
+    import image_processor
+    from image_processor import FontRegistry
+
+    for name in ("A-Regular.ttf", "A-Other.ttf"):
+        (tmp_path / name).write_bytes(b"")
+
+    class FakeFont:
+        def getname(self):
+            return "Fam", None
+
+    monkeypatch.setattr(image_processor.ImageFont, "truetype", lambda path, size: FakeFont())
+    registry = FontRegistry(str(tmp_path))
+    assert registry.families == ["Fam"]
@@ -0,0 +1,68 @@
+import json
+import os
+
+import export_manifest
+from export_manifest import ExportManifest
+
+
+def make_manifest(tmp_path):
+    return ExportManifest(str(tmp_path / "manifest.json"))
+
+
+def record(manifest, tmp_path, name, fingerprint="fp", error=None):
+    path = tmp_path / name
+    path.write_bytes(b"data")
+    stat = os.stat(path)
+    manifest.record(str(path), stat, fingerprint, str(tmp_path / ("out_" + name)), error, 10)
+    return str(path), stat
+
+
+def test_log_is_replayed_on_load(tmp_path):
+    manifest = make_manifest(tmp_path)
+    record(manifest, tmp_path, "a.jpg")
+    path, stat = record(manifest, tmp_path, "a.jpg", fingerprint="fp2")
+    manifest.save()
+    assert not os.path.exists(manifest.path)  # 记录数少，尚未合并
+
+    reloaded = make_manifest(tmp_path)
+    assert reloaded.log_lines == 2
+    assert reloaded.is_current(path, stat, "fp2")
+    assert not reloaded.is_current(path, stat, "fp")
+
+
+def test_compaction_merges_log_into_json(tmp_path, monkeypatch):
+    monkeypatch.setattr(export_manifest, "MANIFEST_COMPACT_MIN", 2)
+    manifest = make_manifest(tmp_path)
+    for _ in range(3):
+        path, stat = record(manifest, tmp_path, "a.jpg")
+    manifest.save()
+    assert manifest.log_lines == 0
+    assert not os.path.exists(manifest.log_path)
+    with open(manifest.path, encoding="utf-8") as f:
+        assert len(json.load(f)["entries"]) == 1
+    assert make_manifest(tmp_path).is_current(path, stat, "fp")
+
+
+def test_half_written_line_is_ignored(tmp_path):
+    manifest = make_manifest(tmp_path)
+    path_a, stat_a = record(manifest, tmp_path, "a.jpg")
+    manifest.save()
+    with open(manifest.log_path, "a", encoding="utf-8") as f:
+        f.write('["broken", {"mti')
+
+    reloaded = make_manifest(tmp_path)
+    assert reloaded.is_current(path_a, stat_a, "fp")
+    path_b, stat_b = record(reloaded, tmp_path, "b.jpg")
+    reloaded.save()
+
+    again = make_manifest(tmp_path)
+    assert again.is_current(path_a, stat_a, "fp")
+    assert again.is_current(path_b, stat_b, "fp")
+
+
+def test_only_content_errors_are_final(tmp_path):
+    manifest = make_manifest(tmp_path)
+    bad, bad_stat = record(manifest, tmp_path, "bad.jpg", error="UnidentifiedImageError: cannot identify image file")
+    io_error, io_stat = record(manifest, tmp_path, "io.jpg", error="OSError: disk full")
+    assert manifest.is_current(bad, bad_stat, "fp")
+    assert not manifest.is_current(io_error, io_stat, "fp")
@@ -0,0 +1,44 @@
+import os
+
+from image_scanner import PathDeduplicator, scan_images
+
+
+def touch(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"")
+    return str(path)
+
+
+def scanned(*args, **kwargs):
+    return [path for batch in scan_images(*args, **kwargs) for path in batch]
+
+
+def test_duplicate_roots_are_scanned_once(tmp_path):
+    a = touch(tmp_path / "a.jpg")
+    b = touch(tmp_path / "sub" / "b.png")
+    touch(tmp_path / "notes.txt")
+    paths = scanned([str(tmp_path), a, str(tmp_path / "sub")])
+    assert sorted(paths) == sorted([a, b])
+
+
+def test_include_and_exclude(tmp_path):
+    keep = touch(tmp_path / "keep.JPG")
+    touch(tmp_path / "skip.png")
+    touch(tmp_path / "raw" / "c.jpg")
+    paths = scanned([str(tmp_path)], include=["*.jpg"], exclude=["raw"])
+    assert paths == [keep]
+
+
+def test_deduplicator_shared_across_scans(tmp_path):
+    a = touch(tmp_path / "a.jpg")
+    deduplicator = PathDeduplicator()
+    assert scanned([str(tmp_path)], deduplicator=deduplicator) == [a]
+    b = touch(tmp_path / "b.jpg")
+    assert scanned([str(tmp_path)], deduplicator=deduplicator) == [b]
+
+
+def test_hard_links_deduped_by_inode(tmp_path):
+    a = touch(tmp_path / "a.jpg")
+    os.link(a, tmp_path / "link.jpg")
+    assert len(scanned([str(tmp_path)], dedupe_inodes=True)) == 1
+    assert len(scanned([str(tmp_path)])) == 2
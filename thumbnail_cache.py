@@ -0,0 +1,130 @@
+"""持久化缩略图缓存
+
+所有缩略图存放在同一个 SQLite 文件中，而不是成千上万个小文件。
+键为 (绝对路径, 缩略图尺寸)，同时记录源文件大小和修改时间，源文件变化后旧缓存自动失效；
+总大小超过上限时按最近访问时间淘汰。
+"""
+from io import BytesIO
+from PIL import Image
+import os
+import sqlite3
+import threading
+import time
+
+from image_processor import THUMBNAIL_SIZE, load_thumbnail
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+class ThumbnailCache:
+    def __init__(self, db_path, max_bytes=DEFAULT_MAX_BYTES):
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        # 缩略图任务在线程池中执行，共用一个连接并用锁串行化
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS thumbnails ("
+            "path TEXT NOT NULL, width INTEGER NOT NULL, height INTEGER NOT NULL, "
+            "file_size INTEGER NOT NULL, mtime REAL NOT NULL, data BLOB NOT NULL, last_access REAL NOT NULL, "
+            "PRIMARY KEY (path, width, height))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS thumbnails_last_access ON thumbnails (last_access)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM thumbnails").fetchone()[0]
+
+    def get(self, file_path, size=THUMBNAIL_SIZE):
+        """返回缓存的缩略图（RGBA），没有缓存或源文件已变化时返回 None"""
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT file_size, mtime, data FROM thumbnails WHERE path = ? AND width = ? AND height = ?",
+                (file_path, size[0], size[1]),
+            ).fetchone()
+            if row is None:
+                return None
+            if row[0] != stat.st_size or row[1] != stat.st_mtime:
+                self._delete(file_path, size, len(row[2]))
+                return None
+            self._conn.execute(
+                "UPDATE thumbnails SET last_access = ? WHERE path = ? AND width = ? AND height = ?",
+                (time.time(), file_path, size[0], size[1]),
+            )
+            self._conn.commit()
+        with Image.open(BytesIO(row[2])) as img:
+            return img.convert("RGBA")
+
+    def put(self, file_path, thumb, size=THUMBNAIL_SIZE):
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        data = encode_thumbnail(thumb)
+        with self._lock:
+            old = self._conn.execute(
+                "SELECT LENGTH(data) FROM thumbnails WHERE path = ? AND width = ? AND height = ?",
+                (file_path, size[0], size[1]),
+            ).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO thumbnails VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (file_path, size[0], size[1], stat.st_size, stat.st_mtime, data, time.time()),
+            )
+            self._total_bytes += len(data) - (old[0] if old else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def get_or_create(self, file_path, size=THUMBNAIL_SIZE):
+        """优先读取缓存，未命中时解码原图并写入缓存"""
+        try:
+            thumb = self.get(file_path, size)
+        except sqlite3.Error:
+            thumb = None
+        if thumb is None:
+            thumb = load_thumbnail(file_path, size)
+            try:
+                self.put(file_path, thumb, size)
+            except sqlite3.Error:
+                pass
+        return thumb
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _delete(self, file_path, size, data_length):
+        self._conn.execute(
+            "DELETE FROM thumbnails WHERE path = ? AND width = ? AND height = ?",
+            (file_path, size[0], size[1]),
+        )
+        self._conn.commit()
+        self._total_bytes -= data_length
+
+    def _evict(self):
+        # 淘汰最久未访问的条目，直到总大小降到上限的 90%
+        target = self.max_bytes * 0.9
+        while self._total_bytes > target:
+            rows = self._conn.execute(
+                "SELECT rowid, LENGTH(data) FROM thumbnails ORDER BY last_access LIMIT 256"
+            ).fetchall()
+            if not rows:
+                self._total_bytes = 0
+                break
+            removed = 0
+            for rowid, length in rows:
+                self._conn.execute("DELETE FROM thumbnails WHERE rowid = ?", (rowid,))
+                removed += length
+                if self._total_bytes - removed <= target:
+                    break
+            self._total_bytes -= removed
+
+
+def encode_thumbnail(thumb):
+    """不透明的缩略图存为 JPEG，带透明通道的存为 PNG"""
+    buffer = BytesIO()
+    if thumb.mode == "RGBA" and thumb.getchannel("A").getextrema()[0] < 255:
+        thumb.save(buffer, format="PNG")
+    else:
+        thumb.convert("RGB").save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
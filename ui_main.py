@@ -1,41 +1,35 @@
 from PyQt5.QtWidgets import (
-    QMainWindow, QFileDialog, QListWidget, QListWidgetItem, QLabel, QPushButton, QVBoxLayout, QWidget, QHBoxLayout, QSlider, QLineEdit, QComboBox, QMessageBox, QFontComboBox, QCheckBox, QSpinBox, QColorDialog, QFrame, QSizePolicy, QInputDialog
+    QMainWindow, QFileDialog, QListWidget, QListWidgetItem, QLabel, QPushButton, QVBoxLayout, QWidget, QHBoxLayout, QSlider, QLineEdit, QComboBox, QMessageBox, QFontComboBox, QCheckBox, QSpinBox, QColorDialog, QFrame, QSizePolicy, QInputDialog, QProgressBar
 )
-from PyQt5.QtCore import Qt, QPoint
+from PyQt5.QtCore import Qt, QObject, QPoint, QRect, QRunnable, QThread, QThreadPool, QTimer, pyqtSignal, pyqtSlot
 from PyQt5.QtGui import QPixmap, QIcon, QColor, QImage, QPainter
-from PIL import Image, ImageDraw, ImageFont  # 添加 ImageDraw, ImageFont
+from image_processor import (
+    FONTS_DIR, SIZE_MODES, IMGWM_SIZE_MODES, THUMBNAIL_SIZE, USER_DATA_DIR, TEMPLATES_FILE, WatermarkSettings, ExportOptions,
+    get_font_registry, get_watermark_bounds, get_watermark_pos, get_watermark_size, load_thumbnail, read_templates,
+    render_drag_layers, render_preview
+)
+from batch_export import build_jobs, default_worker_count, export_parallel
+from encoders import ENCODER_PROFILES, LOSSY_FORMATS, PROFILE_NAMES, available_formats
+from export_manifest import IncrementalExport
+from image_scanner import normalize_path, scan_images
+from thumbnail_cache import ThumbnailCache
+from dataclasses import replace
 import os
 import json
-import sys
-
-try:
-    resample_method = Image.Resampling.LANCZOS
-except AttributeError:
-    resample_method = Image.LANCZOS
-
-def resource_path(relative_path):
-    """获取资源文件的绝对路径，兼容 PyInstaller 打包后的环境"""
-    if hasattr(sys, '_MEIPASS'):
-        return os.path.join(sys._MEIPASS, relative_path)
-    return os.path.join(os.path.abspath("."), relative_path)
+import time
 
-FONTS_DIR = resource_path("fonts")
+PREVIEW_DEBOUNCE_MS = 60
 
-def get_user_data_path():
-    """获取用户本地数据目录"""
-    if sys.platform == "win32":
-        return os.path.join(os.getenv("APPDATA"), "PhotoWatermarker")
-    else:
-        return os.path.join(os.path.expanduser("~"), ".PhotoWatermarker")
-
-USER_DATA_DIR = get_user_data_path()
-TEMPLATES_FILE = os.path.join(USER_DATA_DIR, "templates.json")
-DEFAULT_TEMPLATES_FILE = resource_path("templates.json")
+THUMBNAIL_CACHE_FILE = os.path.join(USER_DATA_DIR, "thumbnails.db")
 
 # 确保用户数据目录存在
 if not os.path.exists(USER_DATA_DIR):
     os.makedirs(USER_DATA_DIR)
 
+def pil_to_qimage(img):
+    """RGBA 的 PIL 图片转为 QImage；copy() 让 QImage 拥有自己的像素数据，不再引用临时的 bytes"""
+    return QImage(img.tobytes("raw", "RGBA"), img.size[0], img.size[1], QImage.Format_RGBA8888).copy()
+
 def get_fonts_in_folder(folder):
     fonts = []
     for fname in os.listdir(folder):
@@ -44,6 +38,8 @@ def get_fonts_in_folder(folder):
     return fonts
 
 class MainWindow(QMainWindow):
+    preview_requested = pyqtSignal(int, str, object, object, object)  # 代数, 图片路径, 水印参数, 导出参数, 尺寸
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("图片水印工具")
@@ -53,12 +49,22 @@ class MainWindow(QMainWindow):
         self.image_watermark_scale = 30  # 百分比
         self.image_watermark_opacity = 80  # 百分比
         self.preview_pixmap = None
+        self.preview_logical_size = None  # 预览对应的导出尺寸
         self.preview_img = None
         self.current_preview_index = 0
         self.watermark_pos_mode = "right_bottom"  # 九宫格/自定义
         self.watermark_offset = None  # 拖拽偏移
         self.dragging = False
         self.custom_pos = None  # (x, y)
+        # 预览在后台线程渲染，每次请求递增代数，只显示最新一代的结果
+        self.preview_generation = 0
+        self.preview_worker = PreviewWorker()
+        self.preview_thread = QThread(self)
+        self.preview_worker.moveToThread(self.preview_thread)
+        self.preview_requested.connect(self.preview_worker.render)
+        self.preview_worker.rendered.connect(self.on_preview_rendered)
+        self.preview_worker.failed.connect(self.on_preview_failed)
+        self.preview_thread.start()
         self.templates = self.load_templates()
         self.init_ui()
         self.load_default_template()  # 自动加载默认模板
@@ -98,6 +104,21 @@ class MainWindow(QMainWindow):
         button_layout.addStretch()
         layout.addLayout(button_layout)
 
+        # 导出进度（后台导出时显示）
+        progress_layout = QHBoxLayout()
+        self.export_progress = QProgressBar()
+        self.export_progress.setFormat("%v / %m")
+        self.export_status_label = QLabel("")
+        self.cancel_export_button = QPushButton("取消导出")
+        self.cancel_export_button.clicked.connect(self.cancel_export)
+        progress_layout.addWidget(self.export_progress)
+        progress_layout.addWidget(self.export_status_label)
+        progress_layout.addWidget(self.cancel_export_button)
+        layout.addLayout(progress_layout)
+        self.export_thread = None
+        self.scan_threads = []
+        self.set_export_running(False)
+
         # 分割线
         self.add_separator(layout)
 
@@ -134,15 +155,55 @@ class MainWindow(QMainWindow):
         # 导出格式与质量
         export_settings_layout.addWidget(QLabel("导出图片格式"))
         self.format_selector = QComboBox()
-        self.format_selector.addItems(["JPEG", "PNG"])
+        self.format_selector.addItems([fmt.upper() for fmt in available_formats()])
+        self.format_selector.currentIndexChanged.connect(self.update_format_mode)
         export_settings_layout.addWidget(self.format_selector)
 
-        export_settings_layout.addWidget(QLabel("JPEG 压缩质量"))
+        export_settings_layout.addWidget(QLabel("压缩质量（JPEG / WebP / AVIF）"))
         self.quality_slider = QSlider(Qt.Horizontal)
         self.quality_slider.setRange(0, 100)
         self.quality_slider.setValue(80)
         export_settings_layout.addWidget(self.quality_slider)
 
+        # 编码档位：在编码速度与文件大小之间取舍
+        encoder_layout = QHBoxLayout()
+        encoder_layout.addWidget(QLabel("编码档位："))
+        self.encoder_combo = QComboBox()
+        self.encoder_combo.addItems([PROFILE_NAMES[profile] for profile in ENCODER_PROFILES])
+        self.encoder_combo.setToolTip("最快编码：PNG 压缩级别 1，大图导出快数倍；最小文件：JPEG 渐进式并优化霍夫曼表，"
+                                      "PNG 压缩级别 9；高保真：不做色度降采样")
+        encoder_layout.addWidget(self.encoder_combo)
+        encoder_layout.addStretch()
+        export_settings_layout.addLayout(encoder_layout)
+        self.update_format_mode()
+
+        # 并行导出进程数
+        workers_layout = QHBoxLayout()
+        workers_layout.addWidget(QLabel("并行导出进程数："))
+        self.workers_spin = QSpinBox()
+        self.workers_spin.setRange(1, 64)
+        self.workers_spin.setValue(default_worker_count())
+        workers_layout.addWidget(self.workers_spin)
+        self.fast_decode_checkbox = QCheckBox("缩小导出时快速解码")
+        self.fast_decode_checkbox.setChecked(True)
+        workers_layout.addWidget(self.fast_decode_checkbox)
+        self.incremental_checkbox = QCheckBox("增量导出（跳过未变化的图片）")
+        workers_layout.addWidget(self.incremental_checkbox)
+        workers_layout.addStretch()
+        export_settings_layout.addLayout(workers_layout)
+
+        # 每个进程处理单张图片的内存上限
+        memory_layout = QHBoxLayout()
+        memory_layout.addWidget(QLabel("单张图片内存上限（MB，0 为不限）："))
+        self.memory_limit_spin = QSpinBox()
+        self.memory_limit_spin.setRange(0, 65536)
+        self.memory_limit_spin.setSingleStep(256)
+        self.memory_limit_spin.setValue(0)
+        self.memory_limit_spin.setToolTip("按图片头信息估算内存，超出上限的超大图片不解码，直接报告错误")
+        memory_layout.addWidget(self.memory_limit_spin)
+        memory_layout.addStretch()
+        export_settings_layout.addLayout(memory_layout)
+
         self.prefix_input = QLineEdit()
         self.prefix_input.setPlaceholderText("自定义导出图片名前缀")
         self.suffix_input = QLineEdit()
@@ -168,17 +229,8 @@ class MainWindow(QMainWindow):
         font_layout = QHBoxLayout()
         font_layout.setSpacing(8)
         self.font_combo = QComboBox()
-        self.font_files = {}
-        if os.path.isdir(FONTS_DIR):
-            for fname in os.listdir(FONTS_DIR):
-                if fname.lower().endswith(('.ttf', '.otf')):
-                    font_name = os.path.splitext(fname)[0]
-                    base_font = font_name.split('-')[0]
-                    if base_font not in self.font_files:
-                        self.font_combo.addItem(base_font)
-                        self.font_files[base_font] = {}
-                    style = font_name[len(base_font):].lower()
-                    self.font_files[base_font][style] = os.path.join(FONTS_DIR, fname)
+        self.font_registry = get_font_registry(FONTS_DIR)
+        self.font_combo.addItems(self.font_registry.families)
         font_layout.addWidget(QLabel("字体"))
         font_layout.addWidget(self.font_combo)
         self.font_size_spin = QSpinBox()
@@ -218,6 +270,16 @@ class MainWindow(QMainWindow):
         self.outline_checkbox = QCheckBox("描边")
         style_layout.addWidget(self.shadow_checkbox)
         style_layout.addWidget(self.outline_checkbox)
+        self.outline_width_spin = QSpinBox()
+        self.outline_width_spin.setRange(1, 50)
+        self.outline_width_spin.setValue(2)
+        self.outline_width_spin.setPrefix("描边宽度:")
+        style_layout.addWidget(self.outline_width_spin)
+        self.outline_color = (0, 0, 0)
+        self.outline_color_button = QPushButton("描边颜色")
+        self.outline_color_button.setStyleSheet("background-color: rgb(0,0,0); color: white;")
+        self.outline_color_button.clicked.connect(self.choose_outline_color)
+        style_layout.addWidget(self.outline_color_button)
         style_layout.addStretch()
         layout.addLayout(style_layout)
 
@@ -288,6 +350,7 @@ class MainWindow(QMainWindow):
         preview_layout.addWidget(preview_label)
         self.preview_area = PreviewLabel(self)
         self.preview_area.setFixedSize(400, 300)
+        self.preview_area.setAlignment(Qt.AlignCenter)  # 与 get_display_transform 的居中映射一致
         self.preview_area.setStyleSheet("background: #eee; border: 1px solid #bbb;")
         preview_layout.addWidget(self.preview_area, alignment=Qt.AlignCenter)
         layout.addLayout(preview_layout)
@@ -311,6 +374,43 @@ class MainWindow(QMainWindow):
         layout.addLayout(pos_layout)
         self.update_pos_buttons()
 
+        # 平铺水印：重复的水印铺满整幅图片，忽略九宫格位置
+        tile_layout = QHBoxLayout()
+        self.tile_checkbox = QCheckBox("平铺水印")
+        self.tile_checkbox.stateChanged.connect(self.update_tile_mode)
+        tile_layout.addWidget(self.tile_checkbox)
+        self.tile_spacing_spin = QSpinBox()
+        self.tile_spacing_spin.setRange(0, 5000)
+        self.tile_spacing_spin.setValue(150)
+        self.tile_spacing_spin.setPrefix("间距:")
+        self.tile_spacing_spin.setSuffix("px")
+        tile_layout.addWidget(self.tile_spacing_spin)
+        self.tile_stagger_spin = QSpinBox()
+        self.tile_stagger_spin.setRange(0, 99)
+        self.tile_stagger_spin.setValue(50)
+        self.tile_stagger_spin.setPrefix("隔行错开:")
+        self.tile_stagger_spin.setSuffix("%")
+        tile_layout.addWidget(self.tile_stagger_spin)
+        tile_layout.addStretch()
+        layout.addLayout(tile_layout)
+        self.update_tile_mode()
+
+        # 旋转角度：滑块与输入框联动
+        rotation_layout = QHBoxLayout()
+        rotation_layout.addWidget(QLabel("旋转角度："))
+        self.rotation_slider = QSlider(Qt.Horizontal)
+        self.rotation_slider.setRange(-180, 180)
+        self.rotation_slider.setValue(0)
+        self.rotation_spin = QSpinBox()
+        self.rotation_spin.setRange(-180, 180)
+        self.rotation_spin.setValue(0)
+        self.rotation_spin.setSuffix("°")
+        self.rotation_slider.valueChanged.connect(self.rotation_spin.setValue)
+        self.rotation_spin.valueChanged.connect(self.rotation_slider.setValue)
+        rotation_layout.addWidget(self.rotation_slider)
+        rotation_layout.addWidget(self.rotation_spin)
+        layout.addLayout(rotation_layout)
+
         # 配置管理功能
         config_layout = QHBoxLayout()
         self.save_template_button = QPushButton("保存模板")
@@ -335,27 +435,37 @@ class MainWindow(QMainWindow):
         self.import_folder_button.clicked.connect(self.import_folder)
         self.export_button.clicked.connect(self.export_images)
 
-        # 信号连接（预览相关）
+        # 信号连接（预览相关），连续的输入合并为一次渲染
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(PREVIEW_DEBOUNCE_MS)
+        self.preview_timer.timeout.connect(self.update_preview)
         self.image_list.currentRowChanged.connect(self.on_image_selected)
-        self.watermark_text_input.textChanged.connect(self.update_preview)
-        self.font_combo.currentIndexChanged.connect(self.update_preview)
-        self.font_size_spin.valueChanged.connect(self.update_preview)
-        self.bold_checkbox.stateChanged.connect(self.update_preview)
-        self.italic_checkbox.stateChanged.connect(self.update_preview)
-        self.watermark_opacity_slider.valueChanged.connect(self.update_preview)
-        self.color_button.clicked.connect(self.update_preview)
-        self.shadow_checkbox.stateChanged.connect(self.update_preview)
-        self.outline_checkbox.stateChanged.connect(self.update_preview)
-        self.imgwm_button.clicked.connect(self.update_preview)
-        self.imgwm_scale_slider.valueChanged.connect(self.update_preview)
-        self.imgwm_width_input.valueChanged.connect(self.update_preview)
-        self.imgwm_height_input.valueChanged.connect(self.update_preview)
-        self.imgwm_size_mode_combo.currentIndexChanged.connect(self.update_preview)
-        self.imgwm_opacity_slider.valueChanged.connect(self.update_preview)
-        self.size_mode_combo.currentIndexChanged.connect(self.update_preview)
-        self.width_input.valueChanged.connect(self.update_preview)
-        self.height_input.valueChanged.connect(self.update_preview)
-        self.percent_input.valueChanged.connect(self.update_preview)
+        self.watermark_text_input.textChanged.connect(self.schedule_preview)
+        self.font_combo.currentIndexChanged.connect(self.schedule_preview)
+        self.font_size_spin.valueChanged.connect(self.schedule_preview)
+        self.bold_checkbox.stateChanged.connect(self.schedule_preview)
+        self.italic_checkbox.stateChanged.connect(self.schedule_preview)
+        self.watermark_opacity_slider.valueChanged.connect(self.schedule_preview)
+        self.color_button.clicked.connect(self.schedule_preview)
+        self.shadow_checkbox.stateChanged.connect(self.schedule_preview)
+        self.outline_checkbox.stateChanged.connect(self.schedule_preview)
+        self.outline_width_spin.valueChanged.connect(self.schedule_preview)
+        self.outline_color_button.clicked.connect(self.schedule_preview)
+        self.imgwm_button.clicked.connect(self.schedule_preview)
+        self.imgwm_scale_slider.valueChanged.connect(self.schedule_preview)
+        self.imgwm_width_input.valueChanged.connect(self.schedule_preview)
+        self.imgwm_height_input.valueChanged.connect(self.schedule_preview)
+        self.imgwm_size_mode_combo.currentIndexChanged.connect(self.schedule_preview)
+        self.imgwm_opacity_slider.valueChanged.connect(self.schedule_preview)
+        self.size_mode_combo.currentIndexChanged.connect(self.schedule_preview)
+        self.width_input.valueChanged.connect(self.schedule_preview)
+        self.height_input.valueChanged.connect(self.schedule_preview)
+        self.percent_input.valueChanged.connect(self.schedule_preview)
+        self.tile_checkbox.stateChanged.connect(self.schedule_preview)
+        self.tile_spacing_spin.valueChanged.connect(self.schedule_preview)
+        self.tile_stagger_spin.valueChanged.connect(self.schedule_preview)
+        self.rotation_spin.valueChanged.connect(self.schedule_preview)
 
         # 信号连接（模板管理）
         self.save_template_button.clicked.connect(self.save_template)
@@ -368,6 +478,12 @@ class MainWindow(QMainWindow):
             self.watermark_color = (color.red(), color.green(), color.blue())
             self.color_button.setStyleSheet(f"background-color: rgb({color.red()},{color.green()},{color.blue()});")
 
+    def choose_outline_color(self):
+        color = QColorDialog.getColor(QColor(*self.outline_color), self, "选择描边颜色")
+        if color.isValid():
+            self.outline_color = (color.red(), color.green(), color.blue())
+            self.outline_color_button.setStyleSheet(f"background-color: rgb({color.red()},{color.green()},{color.blue()}); color: white;")
+
     def import_images(self):
         # 弹出文件选择对话框
         files, _ = QFileDialog.getOpenFileNames(self, "选择图片", "", "Images (*.jpeg *.jpg *.png *.bmp *.tiff)")
@@ -378,10 +494,12 @@ class MainWindow(QMainWindow):
         # 弹出文件夹选择对话框
         folder = QFileDialog.getExistingDirectory(self, "选择文件夹")
         if folder:
-            for root, _, filenames in os.walk(folder):
-                for filename in filenames:
-                    if filename.lower().endswith(('.jpeg', '.jpg', '.png', '.bmp', '.tiff')):
-                        self.image_list.add_image(os.path.join(root, filename))  # 修改为调用 add_image 方法
+            # 在后台线程中流式扫描，扫描到的图片分批加入列表
+            scan_thread = FolderScanThread(folder, self)
+            scan_thread.batch_found.connect(self.image_list.add_images)
+            scan_thread.finished.connect(lambda: self.scan_threads.remove(scan_thread))
+            self.scan_threads.append(scan_thread)
+            scan_thread.start()
 
     def choose_image_watermark(self):
         path, _ = QFileDialog.getOpenFileName(self, "选择图片水印", "", "Images (*.png *.jpg *.jpeg *.bmp *.tiff)")
@@ -435,159 +553,73 @@ class MainWindow(QMainWindow):
                 QMessageBox.warning(self, "警告", "禁止导出到原文件夹，请选择其他文件夹。")
                 return
 
-        output_format = self.format_selector.currentText().lower()
-        quality = self.quality_slider.value()
-        prefix = self.prefix_input.text()
-        suffix = self.suffix_input.text()
-        watermark_text = self.watermark_text_input.text()
-        watermark_opacity = self.watermark_opacity_slider.value()
-        font_base = self.font_combo.currentText()
-        font_size = self.font_size_spin.value()
-        is_bold = self.bold_checkbox.isChecked()
-        is_italic = self.italic_checkbox.isChecked()
-        shadow_enabled = self.shadow_checkbox.isChecked()
-        outline_enabled = self.outline_checkbox.isChecked()
-        imgwm_path = self.image_watermark_path
-        imgwm_scale = self.imgwm_scale_slider.value()
-        imgwm_opacity = self.imgwm_opacity_slider.value()
-        imgwm_size_mode = self.imgwm_size_mode_combo.currentIndex()
-        imgwm_width = self.imgwm_width_input.value()
-        imgwm_height = self.imgwm_height_input.value()
-        size_mode = self.size_mode_combo.currentIndex()
-        width = self.width_input.value()
-        height = self.height_input.value()
-        percent = self.percent_input.value()
-
-        style = ""
-        if is_bold and is_italic:
-            style = "-bolditalic"
-        elif is_bold:
-            style = "-bold"
-        elif is_italic:
-            style = "-italic"
-        font_path = None
-        if font_base in self.font_files:
-            if style in self.font_files[font_base]:
-                font_path = self.font_files[font_base][style]
-            elif "-bold" in self.font_files[font_base] and is_bold:
-                font_path = self.font_files[font_base]["-bold"]
-            elif "-italic" in self.font_files[font_base] and is_italic:
-                font_path = self.font_files[font_base]["-italic"]
-            elif "" in self.font_files[font_base]:
-                font_path = self.font_files[font_base][""]
-            else:
-                font_path = list(self.font_files[font_base].values())[0]
-
-        for index in range(self.image_list.count()):
-            item = self.image_list.item(index)
-            input_path = item.toolTip()
-            base_name, _ = os.path.splitext(os.path.basename(input_path))
-            output_name = f"{prefix + '_' if prefix else ''}{base_name}{suffix}.{output_format}"
-            output_path = os.path.join(folder, output_name)
-
-            with Image.open(input_path) as img:
-                orig_w, orig_h = img.size
-                if size_mode == 1:
-                    new_w = width
-                    new_h = int(orig_h * (width / orig_w))
-                    img = img.resize((new_w, new_h), resample=resample_method)
-                elif size_mode == 2:
-                    new_h = height
-                    new_w = int(orig_w * (height / orig_h))
-                    img = img.resize((new_w, new_h), resample=resample_method)
-                elif size_mode == 3:
-                    scale = percent / 100.0
-                    new_w = int(orig_w * scale)
-                    new_h = int(orig_h * scale)
-                    img = img.resize((new_w, new_h), resample=resample_method)
-
-                img = img.convert("RGBA")
-                if watermark_text:
-                    watermark_layer = Image.new("RGBA", img.size, (0, 0, 0, 0))
-                    draw = ImageDraw.Draw(watermark_layer)
-                    try:
-                        if font_path:
-                            font = ImageFont.truetype(font_path, font_size)
-                        else:
-                            font = ImageFont.load_default()
-                    except Exception:
-                        font = ImageFont.load_default()
-                    try:
-                        bbox = draw.textbbox((0, 0), watermark_text, font=font)
-                        text_width = bbox[2] - bbox[0]
-                        text_height = bbox[3] - bbox[1]
-                    except AttributeError:
-                        text_width, text_height = font.getsize(watermark_text)
-                    alpha = int(255 * (watermark_opacity / 100))
-                    x, y = self.get_watermark_pos(img.size, (text_width, text_height))
-                    if shadow_enabled:
-                        shadow_offset = 2
-                        draw.text((x + shadow_offset, y + shadow_offset), watermark_text, font=font, fill=(0, 0, 0, alpha))
-                    if outline_enabled:
-                        outline_range = 2
-                        for dx in range(-outline_range, outline_range + 1):
-                            for dy in range(-outline_range, outline_range + 1):
-                                if dx == 0 and dy == 0:
-                                    continue
-                                draw.text((x + dx, y + dy), watermark_text, font=font, fill=(0, 0, 0, alpha))
-                    draw.text((x, y), watermark_text, font=font, fill=(*self.watermark_color, alpha))
-                    img = Image.alpha_composite(img, watermark_layer)
-
-                if imgwm_path:
-                    try:
-                        with Image.open(imgwm_path) as wm_img:
-                            wm_img = wm_img.convert("RGBA")
-                            if imgwm_size_mode == 0:
-                                scale = imgwm_scale / 100.0
-                                new_w = int(img.size[0] * scale)
-                                new_h = int(wm_img.size[1] * (new_w / wm_img.size[0]))
-                            elif imgwm_size_mode == 1:
-                                new_w = imgwm_width
-                                new_h = int(wm_img.size[1] * (new_w / wm_img.size[0]))
-                            elif imgwm_size_mode == 2:
-                                new_h = imgwm_height
-                                new_w = int(wm_img.size[0] * (new_h / wm_img.size[1]))
-                            else:
-                                new_w, new_h = wm_img.size
-                            wm_img = wm_img.resize((new_w, new_h), resample=resample_method)
-                            if imgwm_opacity < 100:
-                                alpha = wm_img.split()[-1].point(lambda p: int(p * imgwm_opacity / 100))
-                                wm_img.putalpha(alpha)
-                            x, y = self.get_watermark_pos(img.size, (new_w, new_h))
-                            img.alpha_composite(wm_img, (x, y))
-                    except Exception as e:
-                        print(f"图片水印处理失败: {e}")
-
-                if output_format == "jpeg":
-                    img = img.convert("RGB")
-                    img.save(output_path, format="JPEG", quality=quality)
-                elif output_format == "png":
-                    img.save(output_path, format="PNG")
-            print(f"已导出: {output_path}")  # 调试输出
-            # 图片水印处理
-            if imgwm_path:
-                try:
-                    with Image.open(imgwm_path) as wm_img:
-                        wm_img = wm_img.convert("RGBA")
-                        # 缩放
-                        scale = imgwm_scale / 100.0
-                        new_w = int(img.size[0] * scale)
-                        new_h = int(wm_img.size[1] * (new_w / wm_img.size[0]))
-                        wm_img = wm_img.resize((new_w, new_h), resample=resample_method)
-                        # 透明度
-                        if imgwm_opacity < 100:
-                            alpha = wm_img.split()[-1].point(lambda p: int(p * imgwm_opacity / 100))
-                            wm_img.putalpha(alpha)
-                        # 粘贴到右下角
-                        x = img.size[0] - wm_img.size[0] - 20
-                        y = img.size[1] - wm_img.size[1] - 20
-                        # 合成
-                        if img.mode != "RGBA":
-                            img = img.convert("RGBA")
-                        img.paste(wm_img, (x, y), wm_img)
-                except Exception as e:
-                    print(f"图片水印处理失败: {e}")
-
+        settings = self.get_watermark_settings()
+        options = self.get_export_options()
+        image_paths = [self.image_list.item(index).toolTip() for index in range(self.image_list.count())]
+        if not image_paths:
+            return
+        # 在后台线程中导出，界面保持响应
+        self.export_thread = ExportThread(image_paths, folder, settings, options, self.workers_spin.value(),
+                                          self.incremental_checkbox.isChecked(), self)
+        self.export_thread.progress.connect(self.on_export_progress)
+        self.export_thread.export_finished.connect(self.on_export_finished)
+        self.export_progress.setRange(0, len(image_paths))
+        self.export_progress.setValue(0)
+        self.export_status_label.setText("正在导出...")
+        self.set_export_running(True)
+        self.export_thread.start()
+
+    def cancel_export(self):
+        if self.export_thread is not None:
+            self.export_thread.cancel()
+            self.cancel_export_button.setEnabled(False)
+            self.export_status_label.setText("正在取消，等待当前图片完成...")
+
+    def set_export_running(self, running):
+        self.export_button.setEnabled(not running)
+        self.export_progress.setVisible(running)
+        self.export_status_label.setVisible(running)
+        self.cancel_export_button.setVisible(running)
+        self.cancel_export_button.setEnabled(running)
+
+    def on_export_progress(self, done, total, images_per_sec, mb_per_sec, eta):
+        self.export_progress.setValue(done)
+        eta_text = f"{int(eta // 60)}:{int(eta % 60):02d}" if eta >= 0 else "--:--"
+        self.export_status_label.setText(f"{images_per_sec:.1f} 张/秒  {mb_per_sec:.1f} MB/秒  剩余 {eta_text}")
+
+    def on_export_finished(self, succeeded, skipped, failures, cancelled):
+        self.export_thread = None
+        self.set_export_running(False)
+        message = f"成功导出 {succeeded} 张图片"
+        if skipped:
+            message += f"，跳过未变化的 {skipped} 张"
+        if failures:
+            message += f"，失败 {len(failures)} 张：\n" + "\n".join(failures[:10])
+        if cancelled:
+            QMessageBox.information(self, "已取消", "导出已取消，" + message)
+        elif failures:
+            QMessageBox.warning(self, "导出完成", message)
+        else:
+            QMessageBox.information(self, "导出完成", message)
+
+    def closeEvent(self, event):
+        # 关闭窗口时停止后台导出和文件夹扫描
+        if self.export_thread is not None:
+            self.export_thread.cancel()
+            self.export_thread.wait()
+        for scan_thread in list(self.scan_threads):
+            scan_thread.cancel()
+            scan_thread.wait()
+        self.preview_thread.quit()
+        self.preview_thread.wait()
+        super().closeEvent(event)
+
+    def update_tile_mode(self):
+        tiled = self.tile_checkbox.isChecked()
+        for btn in self.pos_buttons:
+            btn.setEnabled(not tiled)
+        self.tile_spacing_spin.setEnabled(tiled)
+        self.tile_stagger_spin.setEnabled(tiled)
 
     def set_watermark_pos_mode(self, mode):
         self.watermark_pos_mode = mode
@@ -608,159 +640,43 @@ class MainWindow(QMainWindow):
         # 删除重置 custom_pos 的逻辑，保留拖拽后的水印位置
         self.update_preview()
 
+    def schedule_preview(self):
+        # 重新计时，停止输入 PREVIEW_DEBOUNCE_MS 毫秒后才刷新预览
+        self.preview_timer.start()
+
     def update_preview(self):
+        self.preview_timer.stop()
+        self.preview_generation += 1
+        self.preview_worker.latest_generation = self.preview_generation
         # 获取当前图片
         if self.image_list.count() == 0 or self.current_preview_index < 0:
             self.preview_area.clear()
             return
         item = self.image_list.item(self.current_preview_index)
         img_path = item.toolTip()
-        try:
-            with Image.open(img_path) as img:
-                # 尺寸调整
-                size_mode = self.size_mode_combo.currentIndex()
-                width = self.width_input.value()
-                height = self.height_input.value()
-                percent = self.percent_input.value()
-                orig_w, orig_h = img.size
-                if size_mode == 1:
-                    new_w = width
-                    new_h = int(orig_h * (width / orig_w))
-                    img = img.resize((new_w, new_h), resample=resample_method)
-                elif size_mode == 2:
-                    new_h = height
-                    new_w = int(orig_w * (height / orig_h))
-                    img = img.resize((new_w, new_h), resample=resample_method)
-                elif size_mode == 3:
-                    scale = percent / 100.0
-                    new_w = int(orig_w * scale)
-                    new_h = int(orig_h * scale)
-                    img = img.resize((new_w, new_h), resample=resample_method)
-                # 水印合成（与导出一致，位置用 self.get_watermark_pos）
-                img = img.convert("RGBA")
-                preview_img = img.copy()
-                # 文本水印
-                watermark_text = self.watermark_text_input.text()
-                if watermark_text:
-                    watermark_layer = Image.new("RGBA", preview_img.size, (0, 0, 0, 0))
-                    draw = ImageDraw.Draw(watermark_layer)
-                    font_path = None
-                    font_base = self.font_combo.currentText()
-                    font_size = self.font_size_spin.value()
-                    is_bold = self.bold_checkbox.isChecked()
-                    is_italic = self.italic_checkbox.isChecked()
-                    style = ""
-                    if is_bold and is_italic:
-                        style = "-bolditalic"
-                    elif is_bold:
-                        style = "-bold"
-                    elif is_italic:
-                        style = "-italic"
-                    if font_base in self.font_files:
-                        if style in self.font_files[font_base]:
-                            font_path = self.font_files[font_base][style]
-                        elif "-bold" in self.font_files[font_base] and is_bold:
-                            font_path = self.font_files[font_base]["-bold"]
-                        elif "-italic" in self.font_files[font_base] and is_italic:
-                            font_path = self.font_files[font_base]["-italic"]
-                        elif "" in self.font_files[font_base]:
-                            font_path = self.font_files[font_base][""]
-                        else:
-                            font_path = list(self.font_files[font_base].values())[0]
-                    try:
-                        if font_path:
-                            font = ImageFont.truetype(font_path, font_size)
-                        else:
-                            font = ImageFont.load_default()
-                    except Exception:
-                        font = ImageFont.load_default()
-                    try:
-                        bbox = draw.textbbox((0, 0), watermark_text, font=font)
-                        text_width = bbox[2] - bbox[0]
-                        text_height = bbox[3] - bbox[1]
-                    except AttributeError:
-                        text_width, text_height = font.getsize(watermark_text)
-                    alpha = int(255 * (self.watermark_opacity_slider.value() / 100))
-                    # 位置
-                    x, y = self.get_watermark_pos(preview_img.size, (text_width, text_height))
-                    # 阴影
-                    if self.shadow_checkbox.isChecked():
-                        shadow_offset = 2
-                        draw.text((x + shadow_offset, y + shadow_offset), watermark_text, font=font, fill=(0, 0, 0, alpha))
-                    # 描边
-                    if self.outline_checkbox.isChecked():
-                        outline_range = 2
-                        for dx in range(-outline_range, outline_range + 1):
-                            for dy in range(-outline_range, outline_range + 1):
-                                if dx == 0 and dy == 0:
-                                    continue
-                                draw.text((x + dx, y + dy), watermark_text, font=font, fill=(0, 0, 0, alpha))
-                    # 正文
-                    draw.text((x, y), watermark_text, font=font, fill=(*self.watermark_color, alpha))
-                    preview_img = Image.alpha_composite(preview_img, watermark_layer)
-                # 图片水印
-                imgwm_path = self.image_watermark_path
-                imgwm_scale = self.imgwm_scale_slider.value()
-                imgwm_opacity = self.imgwm_opacity_slider.value()
-                imgwm_size_mode = self.imgwm_size_mode_combo.currentIndex()
-                imgwm_width = self.imgwm_width_input.value()
-                imgwm_height = self.imgwm_height_input.value()
-                if imgwm_path:
-                    try:
-                        with Image.open(imgwm_path) as wm_img:
-                            wm_img = wm_img.convert("RGBA")
-                            if imgwm_size_mode == 0:
-                                scale = imgwm_scale / 100.0
-                                new_w = int(preview_img.size[0] * scale)
-                                new_h = int(wm_img.size[1] * (new_w / wm_img.size[0]))
-                            elif imgwm_size_mode == 1:
-                                new_w = imgwm_width
-                                new_h = int(wm_img.size[1] * (new_w / wm_img.size[0]))
-                            elif imgwm_size_mode == 2:
-                                new_h = imgwm_height
-                                new_w = int(wm_img.size[0] * (new_h / wm_img.size[1]))
-                            else:
-                                new_w, new_h = wm_img.size
-                            wm_img = wm_img.resize((new_w, new_h), resample=resample_method)
-                            if imgwm_opacity < 100:
-                                alpha = wm_img.split()[-1].point(lambda p: int(p * imgwm_opacity / 100))
-                                wm_img.putalpha(alpha)
-                            # 位置
-                            x, y = self.get_watermark_pos(preview_img.size, (new_w, new_h))
-                            preview_img.alpha_composite(wm_img, (x, y))
-                    except Exception as e:
-                        pass
-                # 转为QPixmap显示
-                qimg = QImage(preview_img.tobytes("raw", "RGBA"), preview_img.size[0], preview_img.size[1], QImage.Format_RGBA8888)
-                pixmap = QPixmap.fromImage(qimg)
-                self.preview_pixmap = pixmap
-                self.preview_area.setPixmap(pixmap.scaled(self.preview_area.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
-        except Exception:
+        # 代理图为显示区域的 2 倍以保证清晰，渲染与缩放都在后台线程完成
+        max_size = (self.preview_area.width() * 2, self.preview_area.height() * 2)
+        display_size = (self.preview_area.width(), self.preview_area.height())
+        self.preview_requested.emit(self.preview_generation, img_path, self.get_watermark_settings(),
+                                    self.get_export_options(), (max_size, display_size))
+
+    def on_preview_rendered(self, generation, qimg, logical_size):
+        if generation != self.preview_generation:
+            return  # 参数或所选图片已改变，丢弃过期结果
+        self.preview_pixmap = QPixmap.fromImage(qimg)
+        self.preview_logical_size = logical_size
+        self.preview_area.setPixmap(self.preview_pixmap)
+        if not self.preview_area.dragging:
+            self.preview_area.end_drag_overlay()
+
+    def on_preview_failed(self, generation):
+        if generation == self.preview_generation:
+            self.preview_area.end_drag_overlay()
             self.preview_area.clear()
 
     def get_watermark_pos(self, img_size, wm_size):
         # 九宫格/自定义坐标
-        if self.custom_pos:
-            x_percent, y_percent = self.custom_pos
-            x = int(x_percent * img_size[0])
-            y = int(y_percent * img_size[1])
-            return x, y
-        mode = self.watermark_pos_mode
-        W, H = img_size
-        w, h = wm_size
-        margin = 20
-        pos_map = {
-            "left_top": (margin, margin),
-            "center_top": ((W - w) // 2, margin),
-            "right_top": (W - w - margin, margin),
-            "left_center": (margin, (H - h) // 2),
-            "center": ((W - w) // 2, (H - h) // 2),
-            "right_center": (W - w - margin, (H - h) // 2),
-            "left_bottom": (margin, H - h - margin),
-            "center_bottom": ((W - w) // 2, H - h - margin),
-            "right_bottom": (W - w - margin, H - h - margin),
-        }
-        return pos_map.get(mode, (W - w - margin, H - h - margin))
+        return get_watermark_pos(img_size, wm_size, self.watermark_pos_mode, self.custom_pos)
 
     def save_template(self):
         name, ok = QInputDialog.getText(self, "保存模板", "请输入模板名称：")
@@ -795,6 +711,10 @@ class MainWindow(QMainWindow):
         self.template_selector.clear()
         self.template_selector.addItems(self.templates.keys())
 
+    def update_format_mode(self):
+        # PNG 为无损格式，不使用压缩质量
+        self.quality_slider.setEnabled(self.format_selector.currentText().lower() in LOSSY_FORMATS)
+
     def get_current_settings(self):
         return {
             "watermark_text": self.watermark_text_input.text(),
@@ -806,29 +726,81 @@ class MainWindow(QMainWindow):
             "opacity": self.watermark_opacity_slider.value(),
             "shadow": self.shadow_checkbox.isChecked(),
             "outline": self.outline_checkbox.isChecked(),
+            "outline_width": self.outline_width_spin.value(),
+            "outline_color": self.outline_color,
             "image_watermark_path": self.image_watermark_path,
             "image_watermark_scale": self.imgwm_scale_slider.value(),
             "image_watermark_opacity": self.imgwm_opacity_slider.value(),
+            "image_watermark_size_mode": IMGWM_SIZE_MODES[self.imgwm_size_mode_combo.currentIndex()],
+            "image_watermark_width": self.imgwm_width_input.value(),
+            "image_watermark_height": self.imgwm_height_input.value(),
             "position_mode": self.watermark_pos_mode,
             "custom_pos": self.custom_pos,
+            "tile_enabled": self.tile_checkbox.isChecked(),
+            "tile_spacing": self.tile_spacing_spin.value(),
+            "tile_stagger": self.tile_stagger_spin.value(),
+            "rotation": self.rotation_spin.value(),
+            # 导出参数（TEMPLATE_EXPORT_KEYS），随模板保存
+            "output_format": self.format_selector.currentText().lower(),
+            "quality": self.quality_slider.value(),
+            "encoder_profile": tuple(ENCODER_PROFILES)[self.encoder_combo.currentIndex()],
         }
 
+    def get_watermark_settings(self):
+        # 不可变的水印参数，供渲染引擎使用
+        return WatermarkSettings.from_dict(self.get_current_settings())
+
+    def get_export_options(self):
+        return ExportOptions(
+            output_format=self.format_selector.currentText().lower(),
+            quality=self.quality_slider.value(),
+            encoder_profile=tuple(ENCODER_PROFILES)[self.encoder_combo.currentIndex()],
+            prefix=self.prefix_input.text(),
+            suffix=self.suffix_input.text(),
+            size_mode=SIZE_MODES[self.size_mode_combo.currentIndex()],
+            width=self.width_input.value(),
+            height=self.height_input.value(),
+            percent=self.percent_input.value(),
+            fast_decode=self.fast_decode_checkbox.isChecked(),
+            memory_limit_mb=self.memory_limit_spin.value(),
+        )
+
     def apply_settings(self, settings):
         self.watermark_text_input.setText(settings.get("watermark_text", ""))
-        self.font_combo.setCurrentText(settings.get("font", ""))
+        # 旧模板中的字体名是文件名，转换为字体表中的族名
+        font = settings.get("font", "")
+        self.font_combo.setCurrentText(self.font_registry.canonical_family(font) or font)
         self.font_size_spin.setValue(settings.get("font_size", 64))
         self.bold_checkbox.setChecked(settings.get("bold", False))
         self.italic_checkbox.setChecked(settings.get("italic", False))
-        self.watermark_color = settings.get("color", (255, 255, 255))
+        self.watermark_color = tuple(settings.get("color", (255, 255, 255)))
         self.color_button.setStyleSheet(f"background-color: rgb{self.watermark_color};")
         self.watermark_opacity_slider.setValue(settings.get("opacity", 50))
         self.shadow_checkbox.setChecked(settings.get("shadow", False))
         self.outline_checkbox.setChecked(settings.get("outline", False))
+        self.outline_width_spin.setValue(settings.get("outline_width", 2))
+        self.outline_color = tuple(settings.get("outline_color", (0, 0, 0)))
+        self.outline_color_button.setStyleSheet(f"background-color: rgb{self.outline_color}; color: white;")
         self.image_watermark_path = settings.get("image_watermark_path", None)
         self.imgwm_scale_slider.setValue(settings.get("image_watermark_scale", 30))
         self.imgwm_opacity_slider.setValue(settings.get("image_watermark_opacity", 80))
+        imgwm_size_mode = settings.get("image_watermark_size_mode", "scale")
+        self.imgwm_size_mode_combo.setCurrentIndex(IMGWM_SIZE_MODES.index(imgwm_size_mode) if imgwm_size_mode in IMGWM_SIZE_MODES else 0)
+        self.imgwm_width_input.setValue(settings.get("image_watermark_width", 200))
+        self.imgwm_height_input.setValue(settings.get("image_watermark_height", 100))
         self.watermark_pos_mode = settings.get("position_mode", "right_bottom")
         self.custom_pos = settings.get("custom_pos", None)
+        self.tile_checkbox.setChecked(settings.get("tile_enabled", False))
+        self.tile_spacing_spin.setValue(settings.get("tile_spacing", 150))
+        self.tile_stagger_spin.setValue(settings.get("tile_stagger", 50))
+        self.rotation_spin.setValue(settings.get("rotation", 0))
+        # 旧模板没有导出参数时保持当前选择
+        if "output_format" in settings:
+            self.format_selector.setCurrentText(settings["output_format"].upper())
+        if "quality" in settings:
+            self.quality_slider.setValue(settings["quality"])
+        if settings.get("encoder_profile") in ENCODER_PROFILES:
+            self.encoder_combo.setCurrentIndex(tuple(ENCODER_PROFILES).index(settings["encoder_profile"]))
         self.update_pos_buttons()
         self.update_preview()  # 确保预览更新时应用正确的位置
 
@@ -837,14 +809,7 @@ class MainWindow(QMainWindow):
             self.apply_settings(self.templates["default"])
 
     def load_templates(self):
-        if os.path.exists(TEMPLATES_FILE):
-            with open(TEMPLATES_FILE, "r", encoding="utf-8") as f:
-                templates = json.load(f)
-        elif os.path.exists(DEFAULT_TEMPLATES_FILE):
-            with open(DEFAULT_TEMPLATES_FILE, "r", encoding="utf-8") as f:
-                templates = json.load(f)
-        else:
-            templates = {}
+        templates = read_templates()
 
         # 如果没有默认模板，则创建一个默认模板
         if "default" not in templates:
@@ -858,11 +823,20 @@ class MainWindow(QMainWindow):
                 "opacity": 80,
                 "shadow": True,
                 "outline": True,
+                "outline_width": 2,
+                "outline_color": (0, 0, 0),
                 "image_watermark_path": None,
                 "image_watermark_scale": 30,
                 "image_watermark_opacity": 80,
                 "position_mode": "right_bottom",
                 "custom_pos": None,
+                "tile_enabled": False,
+                "tile_spacing": 150,
+                "tile_stagger": 50,
+                "rotation": 0,
+                "output_format": "jpeg",
+                "quality": 80,
+                "encoder_profile": "default",
             }
             self.save_templates_to_file(templates)
 
@@ -875,10 +849,166 @@ class MainWindow(QMainWindow):
             json.dump(templates, f, ensure_ascii=False, indent=4)
 
 
+class ExportThread(QThread):
+    """后台导出线程：调用 batch_export，逐张汇报进度，可在两张图片之间取消
+
+    每次导出都会更新导出文件夹中的清单；勾选增量导出时跳过清单中仍然有效的图片。
+    """
+    progress = pyqtSignal(int, int, float, float, float)  # 已完成, 总数, 张/秒, MB/秒, 剩余秒数
+    export_finished = pyqtSignal(int, int, list, bool)  # 成功数, 跳过数, 失败信息, 是否取消
+
+    def __init__(self, image_paths, folder, settings, options, workers, incremental=False, parent=None):
+        super().__init__(parent)
+        self.image_paths = image_paths
+        self.folder = folder
+        self.settings = settings
+        self.options = options
+        self.workers = workers
+        self.incremental = incremental
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        total = len(self.image_paths)
+        done = 0
+        succeeded = 0
+        failures = []
+        processed_bytes = 0
+        start = time.perf_counter()
+        incremental = None
+        results = None
+        try:
+            incremental = IncrementalExport(self.folder, self.settings, self.options, skip=self.incremental)
+            jobs = incremental.select(build_jobs(self.image_paths, self.folder, self.settings, self.options))
+            results = export_parallel(jobs, workers=self.workers)
+            for result in results:
+                incremental.record(result)
+                done += 1
+                if result.ok:
+                    succeeded += 1
+                    processed_bytes += result.input_bytes
+                else:
+                    failures.append(f"{os.path.basename(result.job.input_path)}: {result.error}")
+                elapsed = max(time.perf_counter() - start, 1e-6)
+                # 跳过的图片计入进度，但不计入速度
+                images_per_sec = done / elapsed
+                remaining = total - done - incremental.skipped
+                eta = remaining / images_per_sec if images_per_sec > 0 else -1
+                self.progress.emit(done + incremental.skipped, total, images_per_sec,
+                                   processed_bytes / elapsed / (1024 * 1024), eta)
+                if self._cancelled:
+                    break
+        except Exception as e:
+            # 任何异常都要发出 export_finished，否则导出按钮一直不可用
+            failures.append(f"导出中断: {type(e).__name__}: {e}")
+        finally:
+            if results is not None:
+                # 关闭生成器会取消尚未开始的任务，已在处理的图片会完整写出
+                try:
+                    results.close()
+                except Exception as e:
+                    failures.append(f"导出中断: {type(e).__name__}: {e}")
+            skipped = 0
+            if incremental is not None:
+                incremental.save()
+                skipped = incremental.skipped
+            self.export_finished.emit(succeeded, skipped, failures,
+                                      self._cancelled and done + skipped < total)
+
+
+class PreviewWorker(QObject):
+    """后台预览渲染：只处理最新一代的请求，排队中的过期请求直接跳过"""
+    rendered = pyqtSignal(int, QImage, object)  # 代数, 预览图, 导出尺寸
+    failed = pyqtSignal(int)
+
+    def __init__(self):
+        super().__init__()
+        self.latest_generation = 0  # 由界面线程更新
+
+    @pyqtSlot(int, str, object, object, object)
+    def render(self, generation, img_path, settings, options, sizes):
+        if generation != self.latest_generation:
+            return
+        max_size, display_size = sizes
+        try:
+            preview_img, logical_size = render_preview(img_path, settings, options, max_size)
+            qimg = pil_to_qimage(preview_img).scaled(display_size[0], display_size[1], Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        except Exception:
+            self.failed.emit(generation)
+            return
+        self.rendered.emit(generation, qimg, logical_size)
+
+
+class FolderScanThread(QThread):
+    """流式扫描文件夹，每找到一批图片就发出一次信号"""
+    batch_found = pyqtSignal(list)
+
+    def __init__(self, folder, parent=None):
+        super().__init__(parent)
+        self.folder = folder
+        self._cancelled = False
+
+    def cancel(self):
+        self._cancelled = True
+
+    def run(self):
+        for batch in scan_images([self.folder]):
+            if self._cancelled:
+                break
+            self.batch_found.emit(batch)
+
+
+class ThumbnailSignals(QObject):
+    loaded = pyqtSignal(str, QImage)
+
+
+class ThumbnailTask(QRunnable):
+    """在线程池中读取缓存或解码缩略图"""
+
+    def __init__(self, file_path, signals, cache=None):
+        super().__init__()
+        self.file_path = file_path
+        self.signals = signals
+        self.cache = cache
+
+    def run(self):
+        try:
+            if self.cache is not None:
+                thumb = self.cache.get_or_create(self.file_path, THUMBNAIL_SIZE)
+            else:
+                thumb = load_thumbnail(self.file_path, THUMBNAIL_SIZE)
+            qimg = pil_to_qimage(thumb)
+        except Exception:
+            qimg = QImage()
+        self.signals.loaded.emit(self.file_path, qimg)
+
+
 class ImageListWidget(QListWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setAcceptDrops(True)  # 启用拖拽
+        # 缩略图：先显示占位图标，只为可见行在线程池中解码
+        self.thumbnail_pool = QThreadPool(self)
+        self.thumbnail_signals = ThumbnailSignals()
+        self.thumbnail_signals.loaded.connect(self.on_thumbnail_loaded)
+        self.thumbnail_state = {}  # 路径 -> "pending" / "done"
+        self.items_by_path = {}  # 规范化路径 -> 列表项，用于去重
+        try:
+            self.thumbnail_cache = ThumbnailCache(THUMBNAIL_CACHE_FILE)
+        except Exception as e:
+            print(f"缩略图缓存不可用: {e}")
+            self.thumbnail_cache = None
+        placeholder = QPixmap(*THUMBNAIL_SIZE)
+        placeholder.fill(QColor("#e0e0e0"))
+        self.placeholder_icon = QIcon(placeholder)
+        self.thumbnail_timer = QTimer(self)
+        self.thumbnail_timer.setSingleShot(True)
+        self.thumbnail_timer.setInterval(30)
+        self.thumbnail_timer.timeout.connect(self.request_visible_thumbnails)
+        # valueChanged 带有滚动位置参数，不能直接连到 start(msec)，否则定时间隔会被改成滚动位置
+        self.verticalScrollBar().valueChanged.connect(lambda _: self.thumbnail_timer.start())
 
     def dragEnterEvent(self, event):
         # 检查拖拽的文件是否是图片
@@ -899,57 +1029,92 @@ class ImageListWidget(QListWidget):
                     self.add_image(file_path)  # 修改为调用 add_image 方法
 
     def add_image(self, file_path):
-        # 添加图片项并显示缩略图
+        # 添加图片项，缩略图稍后在后台生成；已导入的图片不重复添加
+        key = normalize_path(file_path)
+        if key in self.items_by_path:
+            return False
         item = QListWidgetItem()
-        pixmap = QPixmap(file_path).scaled(100, 100, Qt.KeepAspectRatio, Qt.SmoothTransformation)  # 缩略图大小
-        item.setIcon(QIcon(pixmap))
+        item.setIcon(self.placeholder_icon)
         item.setText(os.path.basename(file_path))
         item.setToolTip(file_path)  # 显示完整路径作为工具提示
         self.addItem(item)
-        self.addItem(item)
+        self.items_by_path[key] = item
+        self.thumbnail_timer.start()
+        return True
+
+    def add_images(self, file_paths):
+        # 批量添加时暂停重绘
+        self.setUpdatesEnabled(False)
+        try:
+            for file_path in file_paths:
+                self.add_image(file_path)
+        finally:
+            self.setUpdatesEnabled(True)
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        self.thumbnail_timer.start()
+
+    def request_visible_thumbnails(self):
+        # 只为当前可见的行提交缩略图任务
+        if self.count() == 0:
+            return
+        viewport = self.viewport().rect()
+        first = self.indexAt(viewport.topLeft()).row()
+        last = self.indexAt(viewport.bottomLeft()).row()
+        first = max(first, 0)
+        last = self.count() - 1 if last < 0 else last
+        for row in range(first, last + 1):
+            file_path = self.item(row).toolTip()
+            if file_path not in self.thumbnail_state:
+                self.thumbnail_state[file_path] = "pending"
+                self.thumbnail_pool.start(ThumbnailTask(file_path, self.thumbnail_signals, self.thumbnail_cache))
+
+    def on_thumbnail_loaded(self, file_path, qimg):
+        self.thumbnail_state[file_path] = "done"
+        if qimg.isNull():
+            return
+        item = self.items_by_path.get(normalize_path(file_path))
+        if item is not None:
+            item.setIcon(QIcon(QPixmap.fromImage(qimg)))
 
 
 class PreviewLabel(QLabel):
+    """预览区：拖拽水印时底图与水印图块分别缓存为 QPixmap，移动时只重绘图块，松开鼠标后再完整合成"""
+
     def __init__(self, mainwin):
         super().__init__()
         self.mainwin = mainwin
         self.setMouseTracking(True)
         self.dragging = False
-        self.last_pos = None
+        self.press_pos = None
+        self.drag_start = None  # 按下时水印定位点（导出坐标）
+        self.drag_anchor = None  # 当前水印定位点（导出坐标）
+        self.drag_base = None  # 不含水印的底图
+        self.drag_stamp = None  # 全部水印合成的图块
+        self.drag_stamp_offset = (0, 0)  # 图块相对定位点的偏移（label 像素）
 
     def mousePressEvent(self, event):
         if event.button() == Qt.LeftButton and self.mainwin.preview_pixmap:
             wm_rect = self.get_watermark_rect()
-            if wm_rect and wm_rect.contains(event.pos()):
+            if wm_rect and wm_rect.contains(event.pos()) and self.begin_drag_overlay():
                 self.dragging = True
-                self.last_pos = event.pos()
+                self.press_pos = event.pos()
                 self.setCursor(Qt.ClosedHandCursor)
         super().mousePressEvent(event)
 
     def mouseMoveEvent(self, event):
         if self.dragging and self.mainwin.preview_pixmap:
-            delta = event.pos() - self.last_pos
-            self.last_pos = event.pos()
-            pixmap = self.mainwin.preview_pixmap
-            label_size = self.size()
-            pixmap_size = pixmap.size()
-            scale = min(label_size.width() / pixmap_size.width(), label_size.height() / pixmap_size.height())
-            offset_x = (label_size.width() - pixmap_size.width() * scale) / 2
-            offset_y = (label_size.height() - pixmap_size.height() * scale) / 2
-            # 当前水印左上角
-            x, y = self.mainwin.get_watermark_pos((pixmap_size.width(), pixmap_size.height()), self.get_wm_size())
-            # 鼠标偏移映射到原图
-            dx = int(delta.x() / scale)
-            dy = int(delta.y() / scale)
-            new_x = x + dx
-            new_y = y + dy
-            # 限制不超界
-            new_x = max(0, min(pixmap_size.width() - self.get_wm_size()[0], new_x))
-            new_y = max(0, min(pixmap_size.height() - self.get_wm_size()[1], new_y))
-            self.mainwin.custom_pos = (new_x / pixmap_size.width(), new_y / pixmap_size.height())  # 转换为百分比
-            self.mainwin.watermark_pos_mode = "custom"
-            self.mainwin.update_pos_buttons()
-            self.mainwin.update_preview()
+            logical_w, logical_h = self.mainwin.preview_logical_size
+            scale, offset_x, offset_y = self.get_display_transform()
+            wm_size = self.get_wm_size()
+            # 鼠标相对按下位置的偏移映射到导出坐标，限制不超界
+            delta = event.pos() - self.press_pos
+            new_x = max(0, min(logical_w - wm_size[0], self.drag_start[0] + delta.x() / scale))
+            new_y = max(0, min(logical_h - wm_size[1], self.drag_start[1] + delta.y() / scale))
+            self.drag_anchor = (new_x, new_y)
+            self.mainwin.custom_pos = (new_x / logical_w, new_y / logical_h)  # 转换为百分比
+            self.update()  # 只移动缓存的水印图块，不重新合成
         else:
             # 鼠标悬停时变手型
             wm_rect = self.get_watermark_rect()
@@ -960,96 +1125,89 @@ class PreviewLabel(QLabel):
         super().mouseMoveEvent(event)
 
     def mouseReleaseEvent(self, event):
-        self.dragging = False
+        if self.dragging:
+            self.dragging = False
+            # 松开后完整合成一次；新预览到达前继续显示拖拽图层
+            self.mainwin.update_preview()
         self.setCursor(Qt.ArrowCursor)
         super().mouseReleaseEvent(event)
 
+    def begin_drag_overlay(self):
+        """切换为自定义位置，并准备拖拽用的底图与水印图块；失败时返回 False"""
+        mainwin = self.mainwin
+        logical_size = mainwin.preview_logical_size
+        x, y = mainwin.get_watermark_pos(logical_size, self.get_wm_size())
+        item = mainwin.image_list.item(mainwin.current_preview_index)
+        if item is None:
+            return False
+        mainwin.custom_pos = (x / logical_size[0], y / logical_size[1])
+        mainwin.watermark_pos_mode = "custom"
+        mainwin.update_pos_buttons()
+        settings = replace(mainwin.get_watermark_settings(), position_mode="custom", custom_pos=mainwin.custom_pos)
+        # 与预览相同的代理图尺寸，底图直接取自已缓存的代理图
+        max_size = (self.width() * 2, self.height() * 2)
+        try:
+            base, stamp, logical_size = render_drag_layers(item.toolTip(), settings, mainwin.get_export_options(), max_size)
+        except Exception:
+            return False
+        scale, _, _ = self.get_display_transform()
+        display_size = (max(1, round(logical_size[0] * scale)), max(1, round(logical_size[1] * scale)))
+        self.drag_base = QPixmap.fromImage(pil_to_qimage(base).scaled(
+            display_size[0], display_size[1], Qt.IgnoreAspectRatio, Qt.SmoothTransformation))
+        if stamp is not None:
+            # 底图像素到 label 像素的比例
+            ratio = display_size[0] / base.width
+            stamp_size = (max(1, round(stamp.image.width * ratio)), max(1, round(stamp.image.height * ratio)))
+            self.drag_stamp = QPixmap.fromImage(pil_to_qimage(stamp.image).scaled(
+                stamp_size[0], stamp_size[1], Qt.IgnoreAspectRatio, Qt.SmoothTransformation))
+            self.drag_stamp_offset = (stamp.offset[0] * ratio, stamp.offset[1] * ratio)
+        else:
+            self.drag_stamp = None
+        self.drag_start = (x, y)
+        self.drag_anchor = (x, y)
+        return True
+
+    def end_drag_overlay(self):
+        if self.drag_base is not None:
+            self.drag_base = None
+            self.drag_stamp = None
+            self.update()
+
+    def paintEvent(self, event):
+        if self.drag_base is None:
+            super().paintEvent(event)
+            return
+        QFrame.paintEvent(self, event)  # 背景与边框
+        scale, offset_x, offset_y = self.get_display_transform()
+        painter = QPainter(self)
+        base_rect = QRect(int(round(offset_x)), int(round(offset_y)), self.drag_base.width(), self.drag_base.height())
+        painter.drawPixmap(base_rect.topLeft(), self.drag_base)
+        if self.drag_stamp is not None:
+            painter.setClipRect(base_rect)
+            x = offset_x + self.drag_anchor[0] * scale + self.drag_stamp_offset[0]
+            y = offset_y + self.drag_anchor[1] * scale + self.drag_stamp_offset[1]
+            painter.drawPixmap(int(round(x)), int(round(y)), self.drag_stamp)
+        painter.end()
+
+    def get_display_transform(self):
+        # 导出坐标到label坐标的映射：label坐标 = 导出坐标 * scale + offset
+        logical_w, logical_h = self.mainwin.preview_logical_size
+        label_size = self.size()
+        scale = min(label_size.width() / logical_w, label_size.height() / logical_h)
+        offset_x = (label_size.width() - logical_w * scale) / 2
+        offset_y = (label_size.height() - logical_h * scale) / 2
+        return scale, offset_x, offset_y
+
     def get_watermark_rect(self):
-        # 获取当前水印在label上的rect
-        pixmap = self.mainwin.preview_pixmap
-        if not pixmap:
+        # 获取当前水印在label上的rect；平铺时没有单个可拖拽的水印
+        if not self.mainwin.preview_pixmap or self.mainwin.tile_checkbox.isChecked():
             return None
-        label_size = self.size()
-        pixmap_size = pixmap.size()
-        scale = min(label_size.width() / pixmap_size.width(), label_size.height() / pixmap_size.height())
-        offset_x = (label_size.width() - pixmap_size.width() * scale) / 2
-        offset_y = (label_size.height() - pixmap_size.height() * scale) / 2
-        wm_size = self.get_wm_size()
-        x, y = self.mainwin.get_watermark_pos((pixmap_size.width(), pixmap_size.height()), wm_size)
-        rect_x = int(x * scale + offset_x)
-        rect_y = int(y * scale + offset_y)
-        rect_w = int(wm_size[0] * scale)
-        rect_h = int(wm_size[1] * scale)
-        from PyQt5.QtCore import QRect
-        return QRect(rect_x, rect_y, rect_w, rect_h)
+        scale, offset_x, offset_y = self.get_display_transform()
+        # 可见范围（含描边、阴影与旋转）由缓存的文本度量计算，不渲染水印
+        x, y, w, h = get_watermark_bounds(self.mainwin.get_watermark_settings(), self.mainwin.preview_logical_size)
+        return QRect(int(x * scale + offset_x), int(y * scale + offset_y), int(w * scale), int(h * scale))
 
     def get_wm_size(self):
-        # 估算当前水印大小（文本或图片）
+        # 估算当前水印大小（文本或图片，导出坐标）
         # 只用于判断鼠标是否点中
-        if self.mainwin.image_watermark_path:
-            imgwm_size_mode = self.mainwin.imgwm_size_mode_combo.currentIndex()
-            imgwm_scale = self.mainwin.imgwm_scale_slider.value()
-            imgwm_width = self.mainwin.imgwm_width_input.value()
-            imgwm_height = self.mainwin.imgwm_height_input.value()
-            try:
-                with Image.open(self.mainwin.image_watermark_path) as wm_img:
-                    if imgwm_size_mode == 0:
-                        scale = imgwm_scale / 100.0
-                        new_w = int(self.mainwin.preview_pixmap.width() * scale)
-                        new_h = int(wm_img.size[1] * (new_w / wm_img.size[0]))
-                    elif imgwm_size_mode == 1:
-                        new_w = imgwm_width
-                        new_h = int(wm_img.size[1] * (new_w / wm_img.size[0]))
-                    elif imgwm_size_mode == 2:
-                        new_h = imgwm_height
-                        new_w = int(wm_img.size[0] * (new_h / wm_img.size[1]))
-                    else:
-                        new_w, new_h = wm_img.size
-                    return (new_w, new_h)
-            except Exception:
-                pass
-        # 文本水印
-        watermark_text = self.mainwin.watermark_text_input.text()
-        if watermark_text:
-            font_path = None
-            font_base = self.mainwin.font_combo.currentText()
-            font_size = self.mainwin.font_size_spin.value()
-            is_bold = self.mainwin.bold_checkbox.isChecked()
-            is_italic = self.mainwin.italic_checkbox.isChecked()
-            style = ""
-            if is_bold and is_italic:
-                style = "-bolditalic"
-            elif is_bold:
-                style = "-bold"
-            elif is_italic:
-                style = "-italic"
-            if font_base in self.mainwin.font_files:
-                if style in self.mainwin.font_files[font_base]:
-                    font_path = self.mainwin.font_files[font_base][style]
-                elif "-bold" in self.mainwin.font_files[font_base] and is_bold:
-                    font_path = self.mainwin.font_files[font_base]["-bold"]
-                elif "-italic" in self.mainwin.font_files[font_base] and is_italic:
-                    font_path = self.mainwin.font_files[font_base]["-italic"]
-                elif "" in self.mainwin.font_files[font_base]:
-                    font_path = self.mainwin.font_files[font_base][""]
-                else:
-                    font_path = list(self.mainwin.font_files[font_base].values())[0]
-            try:
-                if font_path:
-                    font = ImageFont.truetype(font_path, font_size)
-                else:
-                    font = ImageFont.load_default()
-            except Exception:
-                font = ImageFont.load_default()
-            try:
-                dummy_img = Image.new("RGBA", (100, 100))
-                draw = ImageDraw.Draw(dummy_img)
-                bbox = draw.textbbox((0, 0), watermark_text, font=font)
-                text_width = bbox[2] - bbox[0]
-                text_height = bbox[3] - bbox[1]
-            except Exception:
-                text_width, text_height = 100, 40
-            return (text_width, text_height)
-        return (60, 40)  # 默认
-        return (60, 40)  # 默认
-        return (60, 40)  # 默认
+        return get_watermark_size(self.mainwin.get_watermark_settings(), self.mainwin.preview_logical_size)
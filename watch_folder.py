@@ -0,0 +1,107 @@
+"""监视文件夹：持续为新增或修改的图片加水印
+
+定时轮询输入文件夹（不依赖 inotify 等平台接口），文件大小和修改时间在两次轮询间保持不变、
+且距最后修改已超过 settle_time 秒才视为写入完成；已处理的图片记录在导出清单中，
+重启后不会重复处理，源图或参数改变后会重新导出；因图片内容失败（无法识别、超出内存上限）的图片不再重试，
+其他失败（读写出错、worker 异常退出）会在之后的轮询中重试。
+多进程导出时，进程池在第一次有图片需要处理时创建，之后各批复用，run() 结束时关闭。
+"""
+import os
+import time
+
+from batch_export import build_jobs, create_executor, export_parallel, is_pool_broken
+from export_manifest import ExportManifest, settings_fingerprint
+from image_scanner import normalize_path, scan_images
+
+
+class FolderWatcher:
+    def __init__(self, roots, output_folder, settings, options, workers=1, interval=2.0, settle_time=2.0,
+                 include=None, exclude=None, manifest=None):
+        self.roots = roots
+        self.output_folder = os.path.abspath(output_folder)
+        self.settings = settings
+        self.options = options
+        self.workers = workers
+        self.interval = interval
+        self.settle_time = settle_time
+        self.include = include
+        self.exclude = exclude
+        self.manifest = manifest or ExportManifest.for_output_folder(self.output_folder)
+        self.fingerprint = settings_fingerprint(settings, options)
+        self.observed = {}  # 规范化路径 -> 上次轮询时的 (大小, 修改时间)
+        self.executor = None  # 多进程时各批共用的进程池
+
+    def poll(self):
+        """扫描一次输入文件夹，返回已写入完成且需要处理的 [(路径, stat), ...]"""
+        output_prefix = normalize_path(self.output_folder) + os.sep
+        now = time.time()
+        ready = []
+        seen = set()
+        for batch in scan_images(self.roots, self.include, self.exclude):
+            for path in batch:
+                key = normalize_path(path)
+                if key.startswith(output_prefix):
+                    continue  # 导出文件夹位于输入文件夹内时，跳过导出结果
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                seen.add(key)
+                if self.manifest.is_current(path, stat, self.fingerprint):
+                    self.observed.pop(key, None)
+                    continue
+                observation = (stat.st_size, stat.st_mtime)
+                previous = self.observed.get(key)
+                self.observed[key] = observation
+                if previous == observation and now - stat.st_mtime >= self.settle_time:
+                    ready.append((path, stat))
+        # 已被删除的文件不再跟踪
+        for key in list(self.observed):
+            if key not in seen:
+                del self.observed[key]
+        return ready
+
+    def process(self, ready, on_result=None):
+        """导出就绪的图片并写入清单，返回结果列表"""
+        os.makedirs(self.output_folder, exist_ok=True)
+        stats = {path: stat for path, stat in ready}
+        jobs = build_jobs([path for path, _ in ready], self.output_folder, self.settings, self.options)
+        results = []
+        if self.workers > 1 and self.executor is None:
+            self.executor = create_executor(self.workers)
+        try:
+            for result in export_parallel(jobs, workers=self.workers, executor=self.executor):
+                path = result.job.input_path
+                # 进程池损坏导致的失败不写入清单，并保留在 observed 中，下一次轮询即重试
+                if not is_pool_broken(result):
+                    self.manifest.record(path, stats[path], self.fingerprint, result.job.output_path, result.error,
+                                         result.output_bytes if result.ok else None)
+                    self.observed.pop(normalize_path(path), None)
+                results.append(result)
+                if on_result is not None:
+                    on_result(result)
+        finally:
+            self.manifest.save()
+        if any(is_pool_broken(result) for result in results):
+            self.close_executor()  # worker 异常退出（如内存不足被杀），下一批重新创建进程池
+        return results
+
+    def close_executor(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+
+    def run(self, on_result=None, should_stop=lambda: False):
+        """持续轮询，直到 should_stop() 返回 True 或收到 KeyboardInterrupt"""
+        try:
+            while not should_stop():
+                ready = self.poll()
+                if ready:
+                    self.process(ready, on_result)
+                else:
+                    time.sleep(self.interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.close_executor()
+            self.manifest.save()